@@ -7,6 +7,7 @@ from typing import Any, List, Dict
 import random
 import csv
 import json
+from functools import partial
 from scipy.spatial import KDTree
 import numpy as np
 
@@ -14,6 +15,7 @@ import bpy
 from mathutils import Vector,Euler,Matrix,Quaternion
 from .voxel_grid import VoxelGrid
 from .tree_mesh_generation import SCATree, force_blender_cleanup
+from .endpoint_sampling import tag_updated_surfaces
 import bmesh
 
 bl_info = {
@@ -61,6 +63,18 @@ class ForestGenerator(bpy.types.Operator):
   )
   tree_configurations: bpy.props.CollectionProperty(type=TreeConfiguration) 
   updateForest: bpy.props.BoolProperty(name="Generate Forest", default=False)
+  collisionProcesses: bpy.props.IntProperty(
+    name="Collision processes",
+    description="Number of worker processes used to resolve collisions between trees, 0 resolves them in Blender itself. "
+      "Workers are forked from Blender, so they are only used in background mode (blender -b) on Linux or macOS",
+    default=0,
+    min=0,
+  )
+  smoothCrowns: bpy.props.BoolProperty(
+    name="Smooth crowns",
+    description="Grow the branches towards a smooth marching cubes surface of the crown voxels instead of their box faces",
+    default=False,
+  )
 
   voxel_model_related_configuration_fields = {
     "crown_width",
@@ -108,6 +122,8 @@ class ForestGenerator(bpy.types.Operator):
     box.label(text="Generation Settings:")
     box.prop(self, 'surface')
     box.prop(self, 'treeConfigurationCount')
+    box.prop(self, 'collisionProcesses')
+    box.prop(self, 'smoothCrowns')
 
     for i, tree_config in enumerate(self.tree_configurations):
       col = box.column(align=True)
@@ -160,8 +176,8 @@ class ForestGenerator(bpy.types.Operator):
     ]
     
     voxel_grid = VoxelGrid()
-    voxel_grid.generate_forest(tree_voxel_configurations, configuration_weights, surface_data)
-    generation_results = [voxel_grid.greedy_meshing(i) for i in range(len(voxel_grid.trees))]
+    voxel_grid.generate_forest(tree_voxel_configurations, configuration_weights, surface_data, collision_processes=self.collisionProcesses)
+    generation_results = [voxel_grid.greedy_meshing(i, surface_only=True) for i in range(len(voxel_grid.trees))]
     tree_configuration_indices = [generation_result[0] for generation_result in generation_results]
     tree_meshes = [generation_result[1] for generation_result in generation_results]
     tree_mesh_locations = KDTree([tree_mesh.location for tree_mesh in tree_meshes])
@@ -171,11 +187,6 @@ class ForestGenerator(bpy.types.Operator):
       rest_collection = bpy.data.collections.new("Rest")
       bpy.context.scene.collection.children.link(rest_collection)
       
-    crown_collection = bpy.data.collections.get("Crown")
-    if not crown_collection:
-      crown_collection = bpy.data.collections.new("Crown")
-      bpy.context.scene.collection.children.link(crown_collection)
-    
     exlusion_collection = bpy.data.collections.get("Exclusion")
     if not exlusion_collection:
       exlusion_collection = bpy.data.collections.new("Exclusion")
@@ -194,10 +205,6 @@ class ForestGenerator(bpy.types.Operator):
     total_time = 0.0
     for i, tree_mesh in enumerate(tree_meshes):
       start_time = time.time()
-      bpy.context.view_layer.update()
-      rest_collection.objects.unlink(tree_mesh)
-      crown_collection.objects.link(tree_mesh)
-      bpy.context.view_layer.update()
       
       max_range = max_crown_radius + tree_voxel_configurations[tree_configuration_indices[i]]["crown_width"] / 2
       
@@ -214,8 +221,7 @@ class ForestGenerator(bpy.types.Operator):
       bpy.context.view_layer.update()
       
       sca_tree = SCATree(
-        useGroups=True,
-        crownGroup="Crown",
+        crownSampler=partial(voxel_grid.sample_crown_surface, i, smooth=self.smoothCrowns),
         exclusionGroup="Exclusion",
         noModifiers=False,
         subSurface=True,
@@ -227,10 +233,6 @@ class ForestGenerator(bpy.types.Operator):
       
       sca_tree_mesh = sca_tree.create_tree(context)
       
-      crown_collection.objects.unlink(tree_mesh)
-      rest_collection.objects.link(tree_mesh)
-      bpy.context.view_layer.update()
-      
       if sca_tree_mesh == None:
         continue
       sca_tree_mesh.location = bpy.context.scene.cursor.location.copy()
@@ -254,7 +256,7 @@ class ForestGenerator(bpy.types.Operator):
     self.updateForest = False
     bpy.context.scene.cursor.location = original_cursor_location
     
-    for collection_name in ['Crown', 'Exclusion', 'Rest']:
+    for collection_name in ['Exclusion', 'Rest']:
       collection = bpy.data.collections.get(collection_name)
       for obj in collection.objects:
         bpy.data.objects.remove(obj, do_unlink=True)
@@ -277,10 +279,12 @@ def register():
   bpy.utils.register_class(TreeConfiguration)
   bpy.utils.register_class(ForestGenerator)
   bpy.types.VIEW3D_MT_mesh_add.append(menu_func)
+  bpy.app.handlers.depsgraph_update_post.append(tag_updated_surfaces)
 
 
 def unregister():
   bpy.types.VIEW3D_MT_mesh_add.remove(menu_func)
+  bpy.app.handlers.depsgraph_update_post.remove(tag_updated_surfaces)
   bpy.utils.unregister_class(TreeConfiguration)
   bpy.utils.unregister_class(ForestGenerator)
       
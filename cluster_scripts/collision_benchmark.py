@@ -0,0 +1,124 @@
+"""
+Collision resolution benchmark for the Blender Forest Simulator
+
+Compares the time per resolved pair of trees when the distances of the collision cells are computed
+on a padded box around them against computing them on the complete tree grids, and against the original
+distance computation, which ran on the complete grids with a mask that is True for every cell.
+The padded box and the complete grids must give identical forests. The original computation measured
+distances from the grid corners, so its forests differ; the number of voxels that changed is reported.
+The forest is built from the shipped tree configurations on a square surface.
+
+Usage:
+    blender -b --python collision_benchmark.py -- [--size 100] [--seed 0] [--repeat 3]
+"""
+
+import bpy
+import sys
+import os
+import json
+import time
+import random
+import argparse
+import importlib
+
+import numpy as np
+from scipy.ndimage import distance_transform_edt
+
+ADDON_MODULE = "Procedual_Blender_Forest_Simulator"
+TREE_CONFIGURATIONS = ["columnar_tree.json", "sphere_tree.json", "spreading_tree.json"]
+
+
+def load_tree_configurations(addon_path):
+    """Load the tree configurations shipped with the addon."""
+    tree_configurations = []
+    for file_name in TREE_CONFIGURATIONS:
+        with open(os.path.join(addon_path, "tree_configs", file_name)) as tree_config_json:
+            tree_configurations.append(json.load(tree_config_json))
+    return tree_configurations
+
+
+def build_forest(voxel_grid_module, sampled_points, tree_configurations):
+    """Create a voxel grid with one unresolved tree per sampled point."""
+    voxel_grid = voxel_grid_module.VoxelGrid()
+    for (x, y), configuration_index in sampled_points:
+        voxel_grid.add_tree((x, y, 0), configuration_index, tree_configurations[configuration_index])
+    return voxel_grid
+
+
+def original_distances_to_tree(voxel_grid_module):
+    """The distance computation before get_distances_to_tree, on the complete grid with the original mask."""
+    cell_type = voxel_grid_module.CellType
+
+    def get_distances_to_tree(tree_grid, cells):
+        mask = (tree_grid != cell_type.stem.value) | (tree_grid != cell_type.crown.value)
+        return distance_transform_edt(mask)[cells[:, 0], cells[:, 1], cells[:, 2]]
+    return get_distances_to_tree
+
+
+def run_benchmark(size, seed, repeat):
+    """Time evaluate_forest with restricted, full and original distance transforms and compare the results."""
+    voxel_grid_module = importlib.import_module(f"{ADDON_MODULE}.voxel_grid")
+    poisson_module = importlib.import_module(f"{ADDON_MODULE}.poisson_disk_sampling")
+    addon_path = os.path.dirname(voxel_grid_module.__file__)
+    tree_configurations = load_tree_configurations(addon_path)
+    crown_widths = [tree_configuration["crown_width"] for tree_configuration in tree_configurations]
+
+    random.seed(seed)
+    surface = [(0, 0), (size, 0), (size, size), (0, size)]
+    sampled_points = poisson_module.poisson_disk_sampling_on_surface(surface, [1.0] * len(tree_configurations), crown_widths)
+    print(f"Sampled {len(sampled_points)} trees on a {size} x {size} surface")
+
+    results = {}
+    for variant in ("original", "full grid", "padded box"):
+        timings = []
+        for _ in range(repeat):
+            voxel_grid = build_forest(voxel_grid_module, sampled_points, tree_configurations)
+            voxel_grid.restrict_distance_transform = variant == "padded box"
+            if variant == "original":
+                voxel_grid.get_distances_to_tree = original_distances_to_tree(voxel_grid_module)
+            random.seed(seed + 1)
+            start = time.perf_counter()
+            voxel_grid.evaluate_forest(tree_configurations)
+            timings.append(time.perf_counter() - start)
+        resolved = voxel_grid.collision_statistics["resolved"]
+        best = min(timings)
+        print(f"{variant:>10}: {best:.3f} s for {resolved} resolved pairs, {1000 * best / max(resolved, 1):.3f} ms per pair")
+        results[variant] = voxel_grid
+
+    identical = all(
+        (tree[-1] == other_tree[-1]).all()
+        for tree, other_tree in zip(results["full grid"].trees, results["padded box"].trees)
+    )
+    print(f"Identical grids of padded box and full grid: {identical}")
+    changed_voxels = sum(
+        int(np.count_nonzero(tree[-1] != other_tree[-1]))
+        for tree, other_tree in zip(results["original"].trees, results["padded box"].trees)
+    )
+    filled_voxels = sum(int(np.count_nonzero(tree[-1])) for tree in results["original"].trees)
+    print(f"Voxels changed against the original distances: {changed_voxels} of {filled_voxels} filled voxels")
+    return identical
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Benchmark the collision resolution of the voxel grid')
+    parser.add_argument('--size', type=float, default=100, help='Edge length of the square surface')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for sampling and resolving the forest')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per variant, the fastest is reported')
+
+    # Blender passes script arguments after '--'
+    if '--' in sys.argv:
+        script_args = sys.argv[sys.argv.index('--') + 1:]
+    else:
+        script_args = sys.argv[1:]
+
+    return parser.parse_args(script_args)
+
+
+if __name__ == "__main__":
+    if ADDON_MODULE not in bpy.context.preferences.addons:
+        bpy.ops.preferences.addon_enable(module=ADDON_MODULE)
+
+    args = parse_arguments()
+    success = run_benchmark(args.size, args.seed, args.repeat)
+    sys.exit(0 if success else 1)
@@ -0,0 +1,90 @@
+"""
+Greedy meshing benchmark for the Blender Forest Simulator
+
+Compares the time to merge the crown cells of every tree of a resolved forest into boxes with the array based
+capture_boxes against the reference implementation capture_quads, and checks that both find the same boxes.
+The forest is built from the shipped tree configurations on a square surface.
+
+Usage:
+    blender -b --python meshing_benchmark.py -- [--size 100] [--seed 0] [--repeat 3]
+"""
+
+import bpy
+import sys
+import os
+import json
+import time
+import random
+import argparse
+import importlib
+
+ADDON_MODULE = "Procedual_Blender_Forest_Simulator"
+TREE_CONFIGURATIONS = ["columnar_tree.json", "sphere_tree.json", "spreading_tree.json"]
+
+
+def load_tree_configurations(addon_path):
+    """Load the tree configurations shipped with the addon."""
+    tree_configurations = []
+    for file_name in TREE_CONFIGURATIONS:
+        with open(os.path.join(addon_path, "tree_configs", file_name)) as tree_config_json:
+            tree_configurations.append(json.load(tree_config_json))
+    return tree_configurations
+
+
+def time_method(method, tree_count, repeat):
+    """Return the fastest time of calling method for every tree and the results of the last run."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [method(index) for index in range(tree_count)]
+        timings.append(time.perf_counter() - start)
+    return min(timings), results
+
+
+def run_benchmark(size, seed, repeat):
+    """Time capture_quads and capture_boxes on a resolved forest and compare the boxes."""
+    voxel_grid_module = importlib.import_module(f"{ADDON_MODULE}.voxel_grid")
+    addon_path = os.path.dirname(voxel_grid_module.__file__)
+    tree_configurations = load_tree_configurations(addon_path)
+
+    random.seed(seed)
+    surface = [(0, 0), (size, 0), (size, size), (0, size)]
+    voxel_grid = voxel_grid_module.VoxelGrid()
+    voxel_grid.generate_forest(tree_configurations, [1.0] * len(tree_configurations), surface)
+    tree_count = len(voxel_grid.trees)
+    print(f"Generated {tree_count} trees on a {size} x {size} surface")
+
+    quads_time, quads = time_method(voxel_grid.capture_quads, tree_count, repeat)
+    boxes_time, boxes = time_method(voxel_grid.capture_boxes, tree_count, repeat)
+    box_count = sum(len(tree_boxes) for tree_boxes in boxes)
+    print(f"capture_quads: {quads_time:.3f} s, {1000 * quads_time / max(tree_count, 1):.3f} ms per tree")
+    print(f"capture_boxes: {boxes_time:.3f} s, {1000 * boxes_time / max(tree_count, 1):.3f} ms per tree, {box_count} boxes")
+
+    identical = all(sorted(tree_quads) == sorted(tree_boxes) for tree_quads, tree_boxes in zip(quads, boxes))
+    print(f"Identical boxes: {identical}")
+    return identical
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Benchmark the greedy meshing of the voxel grid')
+    parser.add_argument('--size', type=float, default=100, help='Edge length of the square surface')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for sampling and resolving the forest')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per implementation, the fastest is reported')
+
+    # Blender passes script arguments after '--'
+    if '--' in sys.argv:
+        script_args = sys.argv[sys.argv.index('--') + 1:]
+    else:
+        script_args = sys.argv[1:]
+
+    return parser.parse_args(script_args)
+
+
+if __name__ == "__main__":
+    if ADDON_MODULE not in bpy.context.preferences.addons:
+        bpy.ops.preferences.addon_enable(module=ADDON_MODULE)
+
+    args = parse_arguments()
+    success = run_benchmark(args.size, args.seed, args.repeat)
+    sys.exit(0 if success else 1)
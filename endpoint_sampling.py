@@ -1,115 +1,194 @@
-from typing import Any, Dict, List
+from collections import OrderedDict
+from typing import List, Set, Tuple
 import bpy
-import random
-import bmesh
-from mathutils import Vector
+from bpy.app.handlers import persistent
+import numpy as np
 
-def sample_mesh_group_surface_points(group_name, num_points, seed=0):
+# maximum number of meshes whose triangles and area CDFs are kept in the surface cache
+SURFACE_CACHE_SIZE = 256
+
+# mesh session uid to the element counts, geometry hash, triangles and cumulative areas of the mesh
+_surface_cache: "OrderedDict[int, Tuple[Tuple[int, int, int], int, np.ndarray, np.ndarray]]" = OrderedDict()
+# session uids of cached meshes whose geometry may have changed since they were cached
+_updated_surfaces: Set[int] = set()
+
+def get_mesh_triangles(mesh, coordinates: np.ndarray = None) -> np.ndarray:
   """
-  Generate points on the surface of all meshes in a group.
-  Uses face area-weighted sampling for uniform distribution.
+  Get the triangles of a mesh as vertex coordinates, using the loop triangles
+  Blender already computes for drawing, so quads and ngons are split correctly.
   
   Args:
-      group_name: Name of the Blender collection/group
-      num_points: Number of points to generate
-      seed: Random seed for reproducibility
+      mesh: Blender mesh datablock
+      coordinates: Flat array of the vertex coordinates, if they were already read
   
   Returns:
-      List of Vector points on the mesh surface
+      Array of shape (n, 3, 3) with the three corners of every triangle in local space
   """
+  mesh.calc_loop_triangles()
   
-  random.seed(seed)
+  if coordinates is None:
+    coordinates = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get('co', coordinates)
+  triangle_vertices = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+  mesh.loop_triangles.foreach_get('vertices', triangle_vertices)
   
-  if group_name not in bpy.data.collections:
-      return []
+  return coordinates.reshape(-1, 3)[triangle_vertices].reshape(-1, 3, 3)
+
+def get_mesh_surface(mesh) -> Tuple[np.ndarray, np.ndarray]:
+  """
+  Get the triangles of a mesh and the cumulative sum of their areas, from the surface cache if possible.
+  Entries are keyed by the session uid of the mesh datablock. An entry is used as is while the element counts
+  of the mesh match and its geometry was not tagged as updated, by tag_updated_surfaces or invalidate_mesh_surface.
+  Otherwise the vertex coordinates and faces are hashed, so only a mesh that really changed is triangulated again.
+  The least recently used entry is evicted once SURFACE_CACHE_SIZE meshes are cached.
   
-  points: List[Vector] = []
-  all_faces: List[Dict[str, Any]] = []
-  total_area = 0.0
+  Args:
+      mesh: Blender mesh datablock
+  
+  Returns:
+      Read-only arrays of the triangles of shape (n, 3, 3) in local space and of the cumulative areas of shape (n,)
+  """
+  key = mesh.session_uid
+  counts = (len(mesh.vertices), len(mesh.loops), len(mesh.polygons))
+  entry = _surface_cache.get(key)
+  if entry is not None and entry[0] == counts and key not in _updated_surfaces:
+    _surface_cache.move_to_end(key)
+    return entry[2], entry[3]
+  
+  coordinates = np.empty(counts[0] * 3, dtype=np.float64)
+  mesh.vertices.foreach_get('co', coordinates)
+  loop_vertices = np.empty(counts[1], dtype=np.int32)
+  mesh.loops.foreach_get('vertex_index', loop_vertices)
+  loop_totals = np.empty(counts[2], dtype=np.int32)
+  mesh.polygons.foreach_get('loop_total', loop_totals)
+  geometry_hash = hash((coordinates.tobytes(), loop_vertices.tobytes(), loop_totals.tobytes()))
+  _updated_surfaces.discard(key)
+  
+  if entry is not None and entry[0] == counts and entry[1] == geometry_hash:
+    _surface_cache.move_to_end(key)
+    return entry[2], entry[3]
+  
+  triangles = get_mesh_triangles(mesh, coordinates)
+  cumulative_areas = np.cumsum(get_triangle_areas(triangles))
+  triangles.flags.writeable = False
+  cumulative_areas.flags.writeable = False
+  
+  _surface_cache[key] = (counts, geometry_hash, triangles, cumulative_areas)
+  _surface_cache.move_to_end(key)
+  if len(_surface_cache) > SURFACE_CACHE_SIZE:
+    _surface_cache.popitem(last=False)
+  return triangles, cumulative_areas
 
-  temporary_meshes: List[bmesh.types.BMesh] = []
+def invalidate_mesh_surface(mesh=None):
+  """
+  Mark the cached surface of a mesh, or of all meshes if no mesh is given, as possibly changed.
+  Needed after editing the geometry of a mesh without a depsgraph update, e.g. with foreach_set,
+  when the element counts stay the same.
+  """
+  if mesh is None:
+    _updated_surfaces.update(_surface_cache.keys())
+  else:
+    _updated_surfaces.add(mesh.session_uid)
 
-  # Collect all faces from all meshes in the group
-  for obj in bpy.data.collections[group_name].objects:
-    if obj.type != 'MESH':
+@persistent
+def tag_updated_surfaces(scene, depsgraph):
+  """
+  depsgraph_update_post handler that marks the cached surfaces of meshes whose geometry was updated.
+  """
+  for update in depsgraph.updates:
+    if not update.is_updated_geometry:
       continue
-          
-    # Get the mesh in world space
-    mesh = obj.data
-    world_matrix = obj.matrix_world
-    
-    # Create bmesh for easier face access
-    bm = bmesh.new()
-    bm.from_mesh(mesh)
-    # bm.transform(world_matrix)
-    
-    # Collect faces with their areas
-    for face in bm.faces:
-      area = face.calc_area()
-      all_faces.append({
-        'face': face,
-        'area': area,
-        'object': obj
-      })
-      total_area += area
-
-    temporary_meshes.append(bm)
+    datablock = update.id.original
+    if isinstance(datablock, bpy.types.Object):
+      datablock = datablock.data
+    if isinstance(datablock, bpy.types.Mesh) and datablock.session_uid in _surface_cache:
+      _updated_surfaces.add(datablock.session_uid)
 
-  if total_area == 0:
-      return []
-  
-  # Generate points using area-weighted sampling
-  for _ in range(num_points):
-    # Pick a random face based on area
-    target_area = random.uniform(0, total_area)
-    cumulative_area = 0.0
-    selected_face_data = None
-    
-    for face_data in all_faces:
-      cumulative_area += face_data['area']
-      if cumulative_area >= target_area:
-        selected_face_data = face_data
-        break
-    
-    if selected_face_data:
-      # Generate random point on the selected face
-      point = generate_point_on_face(selected_face_data['face'])
-      points.append(point)
-
-  for bm in temporary_meshes:
-      bm.free()
+def transform_triangles(triangles: np.ndarray, matrix) -> np.ndarray:
+  """
+  Apply a 4x4 transformation matrix, e.g. an object's matrix_world, to all triangle corners at once.
+  """
+  matrix = np.array(matrix, dtype=np.float64)
+  return triangles @ matrix[:3, :3].T + matrix[:3, 3]
 
-  return points
+def get_triangle_areas(triangles: np.ndarray) -> np.ndarray:
+  """
+  Calculate the areas of triangles given as an (n, 3, 3) array of corners.
+  """
+  edges1 = triangles[:, 1] - triangles[:, 0]
+  edges2 = triangles[:, 2] - triangles[:, 0]
+  return 0.5 * np.linalg.norm(np.cross(edges1, edges2), axis=1)
 
-def generate_point_on_face(face):
+def sample_triangles(triangles: np.ndarray, cumulative_areas: np.ndarray, num_points: int, rng: np.random.Generator) -> np.ndarray:
   """
-  Generate a random point on a triangular face using barycentric coordinates.
+  Sample points uniformly on a set of triangles.
   
   Args:
-      face: bmesh face (assumed to be triangular)
+      triangles: Array of shape (n, 3, 3) with the corners of the triangles
+      cumulative_areas: Cumulative sum of the triangle areas
+      num_points: Number of points to generate
+      rng: NumPy random generator
   
   Returns:
-      Vector point on the face
+      Array of shape (num_points, 3) with the points
   """
-  # Get the three vertices of the face
-  verts = list(face.verts)
+  # pick the triangles by area with a binary search in the cumulative areas
+  target_areas = rng.uniform(0, cumulative_areas[-1], num_points)
+  selected = np.searchsorted(cumulative_areas, target_areas, side='right')
+  selected = np.minimum(selected, len(cumulative_areas) - 1)
   
-  if len(verts) != 3:
-    # Handle non-triangular faces by triangulating
-    # For simplicity, we'll just use the first three vertices
-    # In practice, you might want to properly triangulate
-    verts = verts[:3]
+  r1 = rng.random(num_points)
+  r2 = rng.random(num_points)
+  # reflect points outside the triangle, so that r1 + r2 <= 1 (barycentric constraint)
+  outside = r1 + r2 > 1
+  r1[outside] = 1 - r1[outside]
+  r2[outside] = 1 - r2[outside]
+  r3 = 1 - r1 - r2
   
-  r1 = random.random()
-  r2 = random.random()
+  corners = triangles[selected]
+  return r1[:, None] * corners[:, 0] + r2[:, None] * corners[:, 1] + r3[:, None] * corners[:, 2]
+
+def sample_mesh_group_surface_points(group_name, num_points, seed=0, world_space=False) -> np.ndarray:
+  """
+  Generate points on the surface of all meshes in a group.
+  Uses triangle area-weighted sampling for uniform distribution.
   
-  # Ensure r1 + r2 <= 1 (barycentric constraint)
-  if r1 + r2 > 1:
-    r1 = 1 - r1
-    r2 = 1 - r2
+  Args:
+      group_name: Name of the Blender collection/group
+      num_points: Number of points to generate
+      seed: Random seed for reproducibility
+      world_space: If True, the meshes are transformed by their object's world matrix,
+          so points and area weights are those of the objects as placed in the scene
   
-  r3 = 1 - r1 - r2
+  Returns:
+      Array of shape (num_points, 3) with the points on the mesh surface
+  """
+  
+  if group_name not in bpy.data.collections:
+      return np.zeros((0, 3))
+  
+  # Collect the triangles of all meshes in the group
+  all_triangles: List[np.ndarray] = []
+  all_cumulative_areas: List[np.ndarray] = []
+  total_area = 0.0
+  for obj in bpy.data.collections[group_name].objects:
+    if obj.type != 'MESH':
+      continue
+    triangles, cumulative_areas = get_mesh_surface(obj.data)
+    if world_space:
+      triangles = transform_triangles(triangles, obj.matrix_world)
+      cumulative_areas = np.cumsum(get_triangle_areas(triangles))
+    all_triangles.append(triangles)
+    all_cumulative_areas.append(cumulative_areas + total_area)
+    if len(cumulative_areas) > 0:
+      total_area += cumulative_areas[-1]
+  
+  if not all_triangles:
+      return np.zeros((0, 3))
+  triangles = np.concatenate(all_triangles)
+  cumulative_areas = np.concatenate(all_cumulative_areas)
   
-  point = (r1 * verts[0].co + r2 * verts[1].co + r3 * verts[2].co)
+  if len(cumulative_areas) == 0 or cumulative_areas[-1] == 0:
+      return np.zeros((0, 3))
   
-  return Vector(point)
+  return sample_triangles(triangles, cumulative_areas, num_points, np.random.default_rng(seed))
@@ -1,98 +1,335 @@
-from typing import Tuple, List
+from typing import Tuple, List, Dict, Union, Optional
 import numpy as np
 import random
 import triangle
-from shapely.geometry import Polygon, Point
+from bisect import bisect
+from itertools import accumulate
+from concurrent.futures import ProcessPoolExecutor
+from shapely.geometry import Polygon, MultiPolygon, Point, box
+from shapely.prepared import prep
 
-def poisson_disk_sampling_on_surface(surface: List[Tuple[int, int]], configuration_weights, crown_widths, k=30):
+def random_point_in_triangle(v1, v2, v3):
+  """
+  Generates a random point within a triangle defined by three vertices.
+  
+  :param v1: The first vertex of the triangle as a tuple (x, y).
+  :type v1: Tuple[float, float]
+  :param v2: The second vertex of the triangle as a tuple (x, y).
+  :type v2: Tuple[float, float]
+  :param v3: The third vertex of the triangle as a tuple (x, y).
+  :type v3: Tuple[float, float]
+  :return: A random point within the triangle as a tuple (x, y).
+  :rtype: Tuple[float, float]
+  """
+  
+  r1, r2 = random.random(), random.random()
+  sqrt_r1 = np.sqrt(r1)
+  u = 1 - sqrt_r1
+  v = sqrt_r1 * (1 - r2)
+  w = sqrt_r1 * r2
+  x = u * v1[0] + v * v2[0] + w * v3[0]
+  y = u * v1[1] + v * v2[1] + w * v3[1]
+  return (x, y)
+
+def triangulate_polygon(polygon: Polygon):
+  """
+  Triangulates a polygon, including its holes, with the triangle library.
+  
+  :param polygon: The polygon to triangulate.
+  :type polygon: Polygon
+  :return: A list of triangles, each a tuple of three (x, y) vertices.
+  :rtype: List[Tuple[Tuple[float, float], Tuple[float, float], Tuple[float, float]]]
+  """
+  
+  vertices = []
+  segments = []
+  holes = []
+  for ring_index, ring in enumerate([polygon.exterior] + list(polygon.interiors)):
+    ring_vertices = ring.coords[:-1]
+    offset = len(vertices)
+    vertices.extend(ring_vertices)
+    segments.extend([offset + i, offset + (i+1)%len(ring_vertices)] for i in range(len(ring_vertices)))
+    if ring_index > 0:
+      # triangle removes the triangles reachable from a hole point without crossing a segment
+      hole_point = Polygon(ring).representative_point()
+      holes.append((hole_point.x, hole_point.y))
+  
+  for_triangulate = {'vertices': vertices, 'segments': segments}
+  if holes:
+    for_triangulate['holes'] = holes
+  triangulated = triangle.triangulate(for_triangulate, 'p')
+  # triangle may insert additional vertices where segments intersect
+  vertices = [tuple(vertex) for vertex in triangulated['vertices']]
+  return [tuple(vertices[int(i)] for i in tri) for tri in triangulated.get('triangles', [])]
+
+class PreparedSurface:
+  """
+  A surface prepared for repeated sampling. The triangulation, the cumulative triangle areas and the prepared 
+  geometry used for containment tests are computed once, so they can be shared by all samples drawn on the surface.
+  """
+  
+  def __init__(self, surface):
+    """
+    :param surface: The vertices of a simple polygon, or a shapely Polygon (possibly with holes) or MultiPolygon.
+    :type surface: Union[List[Tuple[float, float]], Polygon, MultiPolygon]
+    """
+    
+    if isinstance(surface, (Polygon, MultiPolygon)):
+      self.geometry = surface
+    else:
+      self.geometry = Polygon(surface)
+    polygons = list(self.geometry.geoms) if isinstance(self.geometry, MultiPolygon) else [self.geometry]
+    
+    self.triangles = []
+    # triangle index ranges of the disjoint polygons, the sampler needs a seed point in each of them
+    self.component_ranges = []
+    # the prepared disjoint polygons, in the same order as their triangle ranges
+    self.components = []
+    for polygon in polygons:
+      if not polygon.is_empty:
+        start = len(self.triangles)
+        self.triangles.extend(triangulate_polygon(polygon))
+        if len(self.triangles) > start:
+          self.component_ranges.append((start, len(self.triangles)))
+          self.components.append(prep(polygon))
+    areas = [
+      0.5 * abs((v2[0] - v1[0]) * (v3[1] - v1[1]) - (v3[0] - v1[0]) * (v2[1] - v1[1]))
+      for v1, v2, v3 in self.triangles
+    ]
+    self.cumulative_areas = list(accumulate(areas))
+    self.prepared = prep(self.geometry)
+    
+    # the edges of all rings, for the vectorized even-odd containment test
+    edges = [
+      (ring.coords[i], ring.coords[i+1])
+      for polygon in polygons
+      for ring in ([polygon.exterior] + list(polygon.interiors) if not polygon.is_empty else [])
+      for i in range(len(ring.coords) - 1)
+    ]
+    edges = np.asarray(edges, dtype=float).reshape(-1, 2, 2)
+    self.edge_starts = edges[:, 0]
+    self.edge_ends = edges[:, 1]
+  
+  def random_point(self, component=None):
+    """
+    Generates a uniformly random point within the surface or within one of its disjoint polygons.
+    
+    :param component: The index of the polygon to sample in, or None to sample the whole surface.
+    :type component: int, optional
+    :return: A random point within the surface.
+    :rtype: Tuple[float, float]
+    """
+    
+    start, end = (0, len(self.triangles)) if component is None else self.component_ranges[component]
+    offset = self.cumulative_areas[start - 1] if start > 0 else 0.0
+    # the same draw as random.choices with the triangle areas as weights
+    total = self.cumulative_areas[end - 1] - offset + 0.0
+    index = bisect(self.cumulative_areas, offset + random.random() * total, start, end - 1)
+    return random_point_in_triangle(*self.triangles[index])
+  
+  def contains(self, position):
+    """
+    Determines if a position lies inside the surface.
+    
+    :param position: The (x, y) coordinates of the position.
+    :type position: Tuple[float, float]
+    :return: True if the position is inside the surface, False otherwise.
+    :rtype: bool
+    """
+    
+    return self.prepared.contains(Point(position))
+  
+  def contains_points(self, positions):
+    """
+    Determines for many positions at once if they lie inside the surface, by counting the crossings of a ray 
+    from every position with the edges of the surface. Holes and disjoint polygons are handled by the even-odd rule.
+    
+    :param positions: An array of shape (n, 2) with the (x, y) coordinates of the positions.
+    :type positions: np.ndarray
+    :return: A boolean array of shape (n,) that is True for the positions inside the surface.
+    :rtype: np.ndarray
+    """
+    
+    x = positions[:, 0, np.newaxis]
+    y = positions[:, 1, np.newaxis]
+    x1, y1 = self.edge_starts[:, 0], self.edge_starts[:, 1]
+    x2, y2 = self.edge_ends[:, 0], self.edge_ends[:, 1]
+    spans = (y1 > y) != (y2 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      crossing_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    crossings = np.count_nonzero(spans & (x < crossing_x), axis=1)
+    return crossings % 2 == 1
+
+class AliasTable:
+  """
+  A Walker alias table for drawing indices with probabilities proportional to a list of weights in constant time.
+  The table is built once in linear time, every draw then takes one uniform random number, 
+  instead of accumulating the weights again as random.choices does on every call.
+  """
+  
+  def __init__(self, weights):
+    """
+    :param weights: The non-negative weights of the indices.
+    :type weights: List[float]
+    """
+    
+    weights = np.asarray(weights, dtype=float)
+    total = weights.sum()
+    if len(weights) == 0 or not total > 0:
+      raise ValueError("The total of the weights must be greater than zero")
+    
+    count = len(weights)
+    scaled = weights * count / total
+    self.probabilities = np.ones(count)
+    self.aliases = np.arange(count)
+    small = [i for i in range(count) if scaled[i] < 1.0]
+    large = [i for i in range(count) if scaled[i] >= 1.0]
+    # Vose's method: every small column is filled up with the excess of a large one
+    while small and large:
+      less = small.pop()
+      more = large.pop()
+      self.probabilities[less] = scaled[less]
+      self.aliases[less] = more
+      scaled[more] = scaled[more] + scaled[less] - 1.0
+      if scaled[more] < 1.0:
+        small.append(more)
+      else:
+        large.append(more)
+    # the remaining columns are full up to rounding errors
+    self.probabilities_list = self.probabilities.tolist()
+    self.aliases_list = self.aliases.tolist()
+  
+  def __len__(self):
+    return len(self.probabilities_list)
+  
+  def draw(self):
+    """
+    Draws one index using the random module.
+    
+    :return: The drawn index.
+    :rtype: int
+    """
+    
+    # the integer part of the scaled random number selects the column, the fractional part decides between column and alias
+    scaled = random.random() * len(self.probabilities_list)
+    column = int(scaled)
+    if scaled - column < self.probabilities_list[column]:
+      return column
+    return self.aliases_list[column]
+  
+  def draw_many(self, count, rng=None):
+    """
+    Draws many indices at once.
+    
+    :param count: The number of indices to draw.
+    :type count: int
+    :param rng: The NumPy generator to draw with, by default a generator seeded from the random module.
+    :type rng: np.random.Generator, optional
+    :return: An array of shape (count,) with the drawn indices.
+    :rtype: np.ndarray
+    """
+    
+    if rng is None:
+      rng = np.random.default_rng(random.getrandbits(64))
+    scaled = rng.random(count) * len(self.probabilities_list)
+    columns = scaled.astype(np.intp)
+    return np.where(scaled - columns < self.probabilities[columns], columns, self.aliases[columns])
+
+def exclusion_distance_table(crown_widths):
+  """
+  Computes the minimum distance between two trees for every pair of configurations, 
+  which depends on the crown widths of both configurations.
+  
+  :param crown_widths: A list of crown widths, one for each configuration.
+  :type crown_widths: List[float]
+  :return: A table where entry [i][j] is the minimum distance between trees of the configurations i and j.
+  :rtype: List[List[float]]
+  """
+  
+  return [
+    [max(crown_widths[i], crown_widths[j]) / 2 + min(crown_widths[i], crown_widths[j]) * 0.2 for j in range(len(crown_widths))]
+    for i in range(len(crown_widths))
+  ]
+
+def poisson_disk_sampling_on_surface(surface: Union[List[Tuple[int, int]], Polygon, MultiPolygon, PreparedSurface], configuration_weights, crown_widths, k=30, batched=False, existing_points=None):
   """
   Generates a set of points on a surface using Poisson disk sampling, ensuring that points are not too close to each other
   based on a distance threshold influenced by crown widths and configuration weights.
   
-  :param surface: A list of tuples representing the vertices of the polygonal surface where points will be sampled.
-  :type surface: List[Tuple[int, int]]
+  :param surface: A list of tuples representing the vertices of the polygonal surface where points will be sampled,
+          a shapely Polygon with holes or MultiPolygon, or a PreparedSurface to reuse across calls.
+  :type surface: Union[List[Tuple[int, int]], Polygon, MultiPolygon, PreparedSurface]
   :param configuration_weights: A list of weights used to randomly select configurations for the points.
   :type configuration_weights: List[float]
   :param crown_widths: A list of crown widths corresponding to each configuration, used to calculate distance thresholds.
   :type crown_widths: List[float]
   :param k: The number of attempts to generate a valid point around an existing point before marking it as inactive.
   :type k: int, optional
+  :param batched: If True, all k candidates around an active point are drawn and tested at once with NumPy. 
+          The candidates follow the same distribution, but are drawn from a NumPy generator seeded from the random module,
+          so a given seed yields different points than the unbatched mode.
+  :type batched: bool, optional
+  :param existing_points: Points that were already sampled, e.g. on neighboring tiles. New points keep their distance to them
+          and also grow from them, but they are not part of the result. The samples grow from these points first, 
+          only the disjoint polygons of the surface they do not reach get a random initial point.
+  :type existing_points: List[Tuple[Tuple[float, float], int]], optional
   :return: A list of tuples, where each tuple contains the coordinates of a point and its associated configuration index.
   :rtype: List[Tuple[Tuple[float, float], int]]
   """
   
-  def random_point_in_triangle(v1, v2, v3):
+  def grid_cell(position):
     """
-    Generates a random point within a triangle defined by three vertices.
+    Determines the cell of the background grid that contains a position.
     
-    :param v1: The first vertex of the triangle as a tuple (x, y).
-    :type v1: Tuple[float, float]
-    :param v2: The second vertex of the triangle as a tuple (x, y).
-    :type v2: Tuple[float, float]
-    :param v3: The third vertex of the triangle as a tuple (x, y).
-    :type v3: Tuple[float, float]
-    :return: A random point within the triangle as a tuple (x, y).
-    :rtype: Tuple[float, float]
+    :param position: The (x, y) coordinates of the position.
+    :type position: Tuple[float, float]
+    :return: The (column, row) index of the grid cell.
+    :rtype: Tuple[int, int]
     """
     
-    
-    r1, r2 = random.random(), random.random()
-    sqrt_r1 = np.sqrt(r1)
-    u = 1 - sqrt_r1
-    v = sqrt_r1 * (1 - r2)
-    w = sqrt_r1 * r2
-    x = u * v1[0] + v * v2[0] + w * v3[0]
-    y = u * v1[1] + v * v2[1] + w * v3[1]
-    return (x, y)
+    return int(np.floor(position[0] / cell_size)), int(np.floor(position[1] / cell_size))
   
-  def random_point_in_polygon(surface: Polygon):
+  def add_sample(point):
     """
-    Generates a uniformly random point within a given polygon by triangulating the polygon.
+    Adds an accepted point to the list of points and registers it in the background grid.
     
-    :param surface: A polygon within which a random point is to be generated.
-    :type surface: Polygon
-    :return: A random point within the given polygon.
-    :rtype: Tuple[float, float]
+    :param point: A tuple containing the coordinates of the point and its associated index.
+            Format: ((x, y), index)
+    :type point: Tuple[Tuple[float, float], int]
+    :return: None
     """
     
-    for_triangulate = {
-      'vertices': surface.exterior.coords[:-1],
-      'segments': [[i, (i+1)%(len(surface.exterior.coords)-1)] for i in range(len(surface.exterior.coords)-1)]
-    }
-    triangulated = triangle.triangulate(for_triangulate, 'p')
-    triangles = [[surface.exterior.coords[int(i)] for i in tri] for tri in triangulated['triangles']]
-    areas = []
-    tri_list = []
-    for tri in triangles:
-        v1, v2, v3 = tri[0], tri[1], tri[2]
-        area = 0.5 * abs((v2[0] - v1[0]) * (v3[1] - v1[1]) - (v3[0] - v1[0]) * (v2[1] - v1[1]))
-        areas.append(area)
-        tri_list.append((v1, v2, v3))
-    
-    chosen_triangle = random.choices(tri_list, weights=areas, k=1)[0]
-    
-    return random_point_in_triangle(*chosen_triangle)
+    grid.setdefault(grid_cell(point[0]), []).append(len(points))
+    points.append(point)
 
-  def too_near_to_sample(point, points):
+  def too_near_to_sample(point):
     """
     Determines if a given point is too close to any existing points based on a distance threshold function 
     calculated using crown widths.
+    Only the points in the 3x3 block of grid cells around the point are compared, as the cell size equals the
+    largest possible distance threshold.
     
     :param point: A tuple containing the coordinates of the point and its associated index.
             Format: ((x, y), index)
     :type point: Tuple[Tuple[float, float], int]
-    :param points: A list of tuples, where each tuple contains the coordinates of a point and its associated index.
-             Format: [((x, y), index), ...]
-    :type points: List[Tuple[Tuple[float, float], int]]
     :return: True if the given point is too close to any existing points, False otherwise.
     :rtype: bool
     """
     
+    column, row = grid_cell(point[0])
+    neighbor_points = [
+      points[neighbor_index]
+      for neighbor_column in range(column - 1, column + 2)
+      for neighbor_row in range(row - 1, row + 2)
+      for neighbor_index in grid.get((neighbor_column, neighbor_row), ())
+    ]
+    if len(neighbor_points) == 0:
+      return False
+    
     return any(
       np.linalg.norm(np.asarray([point[0][0], point[0][1]]) 
-        - np.asarray([[neighbor_point[0][0], neighbor_point[0][1]] for neighbor_point in points]), axis=1) 
-      <= np.array([max(crown_widths[neighbor_point[1]], crown_widths[point[1]]) / 2 + 
-                   min(crown_widths[neighbor_point[1]], crown_widths[point[1]]) * 0.2 for neighbor_point in points])
+        - np.asarray([[neighbor_point[0][0], neighbor_point[0][1]] for neighbor_point in neighbor_points]), axis=1) 
+      <= np.array([exclusion_distances[neighbor_point[1]][point[1]] for neighbor_point in neighbor_points])
     )
 
   def generate_random_point_around(point, new_configuration_index):
@@ -124,6 +361,95 @@ def poisson_disk_sampling_on_surface(surface: List[Tuple[int, int]], configurati
     new_y = position[1] + radius * np.sin(angle)
     return (new_x, new_y)
   
+  def generate_random_points_around(point):
+    """
+    Generates k random candidate disks around an existing disk at once, following the same distribution as
+    chooseRandomConfiguration and generate_random_point_around.
+    
+    :param point: A tuple containing the position and index of the current point. The position is a tuple of (x, y) coordinates.
+    :type point: Tuple[Tuple[float, float], int]
+    :return: An array of shape (k, 2) with the candidate positions and an array of shape (k,) with their configuration indices.
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    
+    configurations = configuration_table.draw_many(k, rng)
+    r1 = rng.random(k)
+    r2 = rng.random(k)
+    radius = exclusion_distance_array[point[1], configurations] * (r1 + 1)
+    angle = 2 * np.pi * r2
+    positions = np.empty((k, 2))
+    positions[:, 0] = point[0][0] + radius * np.cos(angle)
+    positions[:, 1] = point[0][1] + radius * np.sin(angle)
+    return positions, configurations
+  
+  def first_valid_candidate(point, positions, configurations):
+    """
+    Finds the first candidate that lies inside the surface and is not too near to any existing point.
+    The candidates are at most two grid cells away from the cell of the point they were generated around,
+    so only the points in the 7x7 block of grid cells around it are compared.
+    
+    :param point: The point the candidates were generated around.
+    :type point: Tuple[Tuple[float, float], int]
+    :param positions: An array of shape (k, 2) with the candidate positions.
+    :type positions: np.ndarray
+    :param configurations: An array of shape (k,) with the configuration indices of the candidates.
+    :type configurations: np.ndarray
+    :return: The index of the first valid candidate, or None if there is none.
+    :rtype: Optional[int]
+    """
+    
+    valid = surface.contains_points(positions)
+    if not valid.any():
+      return None
+    column, row = grid_cell(point[0])
+    neighbor_indices = [
+      neighbor_index
+      for neighbor_column in range(column - 3, column + 4)
+      for neighbor_row in range(row - 3, row + 4)
+      for neighbor_index in grid.get((neighbor_column, neighbor_row), ())
+    ]
+    neighbor_positions = np.asarray([points[neighbor_index][0] for neighbor_index in neighbor_indices])
+    neighbor_configurations = np.asarray([points[neighbor_index][1] for neighbor_index in neighbor_indices])
+    distances = np.linalg.norm(positions[:, np.newaxis] - neighbor_positions[np.newaxis], axis=2)
+    thresholds = exclusion_distance_array[neighbor_configurations[np.newaxis], configurations[:, np.newaxis]]
+    valid &= ~np.any(distances <= thresholds, axis=1)
+    if not valid.any():
+      return None
+    return int(np.argmax(valid))
+  
+  def grow():
+    """
+    Generates new points around the active points until no active point is left.
+    
+    :return: None
+    """
+    
+    while active_list:
+      idx = random.randint(0, len(active_list) - 1)
+      point = active_list[idx]
+      if batched:
+        positions, configurations = generate_random_points_around(point)
+        candidate = first_valid_candidate(point, positions, configurations)
+        if candidate is None:
+          active_list.pop(idx)
+        else:
+          new_point = ((float(positions[candidate, 0]), float(positions[candidate, 1])), int(configurations[candidate]))
+          add_sample(new_point)
+          active_list.append(new_point)
+        continue
+      found = False
+      for _ in range(k):
+        new_configuration = chooseRandomConfiguration()
+        new_position = generate_random_point_around(point, new_configuration)
+        new_point = (new_position, new_configuration)
+        if surface.contains(new_position) and not too_near_to_sample(new_point):
+          add_sample(new_point)
+          active_list.append(new_point)
+          found = True
+          break
+      if not found:
+        active_list.pop(idx)
+  
   def chooseRandomConfiguration():
     """
     Selects a random configuration index based on the provided configuration weights.
@@ -131,35 +457,208 @@ def poisson_disk_sampling_on_surface(surface: List[Tuple[int, int]], configurati
     :rtype: int
     """
     
-    return random.choices(range(len(configuration_weights)), weights=configuration_weights, k=1)[0]
+    return configuration_table.draw()
   
   active_list: List[Tuple[Tuple[float, float], int]] = []
   points: List[Tuple[Tuple[float, float], int]] = []
 
-  if surface == []:
+  if isinstance(surface, list) and surface == []:
     return []
   
-  polygon = Polygon(surface)
-  initial_position = random_point_in_polygon(polygon)
-  configuration_index = chooseRandomConfiguration()
-  initial_point = (initial_position, configuration_index)
-  points.append(initial_point)
-  active_list.append(initial_point)
-
-  while active_list:
-    idx = random.randint(0, len(active_list) - 1)
-    point = active_list[idx]
-    found = False
+  # the minimum distance between two trees depends on both of their configurations
+  exclusion_distances = exclusion_distance_table(crown_widths)
+  # background grid mapping a cell to the indices of the points inside it, 
+  # the cell size is the largest distance at which two points can be too near to each other
+  cell_size = max(max(distances) for distances in exclusion_distances)
+  if cell_size <= 0:
+    cell_size = 1.0
+  grid: Dict[Tuple[int, int], List[int]] = {}
+  # configurations are drawn k times per active point, so the weights are turned into an alias table once
+  configuration_table = AliasTable(configuration_weights)
+  
+  if batched:
+    exclusion_distance_array = np.asarray(exclusion_distances, dtype=float)
+    # seeded from the random module, so random.seed keeps the sampling reproducible
+    rng = np.random.default_rng(random.getrandbits(64))
+  
+  if not isinstance(surface, PreparedSurface):
+    surface = PreparedSurface(surface)
+  existing_points = existing_points or []
+  for existing_point in existing_points:
+    add_sample(existing_point)
+    active_list.append(existing_point)
+  # a random initial point in a polygon that the existing points reach would crowd the points grown from them
+  grow()
+  reached = [
+    any(component.contains(Point(point[0])) for point in points[len(existing_points):])
+    for component in surface.components
+  ] if existing_points else [False] * len(surface.components)
+  # every disjoint polygon of the surface gets its own initial point, as the samples only grow within one
+  for component in range(len(surface.component_ranges)):
+    if reached[component]:
+      continue
     for _ in range(k):
-      new_configuration = chooseRandomConfiguration()
-      new_position = generate_random_point_around(point, new_configuration)
-      new_point = (new_position, new_configuration)
-      if polygon.contains(Point(new_position)) and not too_near_to_sample(new_point, points):
-        points.append(new_point)
-        active_list.append(new_point)
-        found = True
+      initial_position = surface.random_point(component)
+      configuration_index = chooseRandomConfiguration()
+      initial_point = (initial_position, configuration_index)
+      if not too_near_to_sample(initial_point):
+        add_sample(initial_point)
+        active_list.append(initial_point)
         break
-    if not found:
-      active_list.pop(idx)
+  grow()
+
+  return points[len(existing_points):]
+
+def sample_tile(geometry, tile_bounds, existing_points, configuration_weights, crown_widths, k, batched, seed, margins=(0, 0, 0, 0)):
+  """
+  Samples the part of a surface inside one tile. This is a module level function, so it can run in a worker process.
+  The global random state is restored afterwards, as the tile is sampled with its own seed.
+  
+  :param geometry: The whole sampling surface.
+  :type geometry: Union[Polygon, MultiPolygon]
+  :param tile_bounds: The bounds (min_x, min_y, max_x, max_y) of the tile.
+  :type tile_bounds: Tuple[float, float, float, float]
+  :param existing_points: The points of the neighboring tiles that were already sampled and are near the sampled area.
+  :type existing_points: List[Tuple[Tuple[float, float], int]]
+  :param seed: The seed used for sampling the tile.
+  :type seed: int
+  :param margins: How far the sampled area extends beyond the (min_x, min_y, max_x, max_y) sides of the tile. 
+          The points in the margins are dropped, they only keep the points of the tile from packing against its border.
+  :type margins: Tuple[float, float, float, float], optional
+  :return: The points sampled inside the tile.
+  :rtype: List[Tuple[Tuple[float, float], int]]
+  """
+  
+  min_x, min_y, max_x, max_y = tile_bounds
+  sampling_bounds = (min_x - margins[0], min_y - margins[1], max_x + margins[2], max_y + margins[3])
+  clipped = geometry.intersection(box(*sampling_bounds))
+  polygons = [
+    polygon for polygon in getattr(clipped, 'geoms', [clipped])
+    if isinstance(polygon, Polygon) and polygon.area > 0
+  ]
+  if not polygons:
+    return []
+  
+  state = random.getstate()
+  random.seed(seed)
+  try:
+    points = poisson_disk_sampling_on_surface(
+      MultiPolygon(polygons), configuration_weights, crown_widths, k=k, batched=batched, existing_points=existing_points
+    )
+  finally:
+    random.setstate(state)
+  return [
+    point for point in points
+    if (margins[0] == 0 or point[0][0] >= min_x) and (margins[1] == 0 or point[0][1] >= min_y)
+    and (margins[2] == 0 or point[0][0] < max_x) and (margins[3] == 0 or point[0][1] < max_y)
+  ]
 
-  return points
\ No newline at end of file
+def poisson_disk_sampling_tiles(surface, configuration_weights, crown_widths, tile_size=None, k=30, batched=False, processes=None):
+  """
+  Generates the same kind of points as poisson_disk_sampling_on_surface, but partitions the surface into square tiles and 
+  yields the points tile by tile, so the points of the first tiles can be processed while later tiles are still sampled.
+  
+  The tiles are sampled row by row, first the tiles in even columns and then the ones in odd columns. Tiles sampled together
+  are at least one tile apart, which is not less than the largest exclusion distance, so they can be sampled independently
+  and in parallel. Every tile respects and grows from the points of its already sampled neighbors near its border and
+  only gets a random initial point where they do not reach. Towards the neighbors that are not sampled yet, the tile is 
+  sampled with a margin of the largest exclusion distance whose points are dropped, so its points do not pack against 
+  the border as they would at the border of the surface. Thereby the density does not change at the borders between tiles. Only the points of the previous tile row are kept.
+  Every tile is sampled with its own seed drawn from the random module, so the result does not depend on the number of processes.
+  
+  :param surface: The surface, in any form accepted by poisson_disk_sampling_on_surface.
+  :type surface: Union[List[Tuple[int, int]], Polygon, MultiPolygon, PreparedSurface]
+  :param configuration_weights: A list of weights used to randomly select configurations for the points.
+  :type configuration_weights: List[float]
+  :param crown_widths: A list of crown widths corresponding to each configuration, used to calculate distance thresholds.
+  :type crown_widths: List[float]
+  :param tile_size: The edge length of the tiles, by default eight times the largest exclusion distance.
+  :type tile_size: float, optional
+  :param k: The number of attempts to generate a valid point around an existing point before marking it as inactive.
+  :type k: int, optional
+  :param batched: If True, the candidates are drawn and tested in batches, see poisson_disk_sampling_on_surface.
+  :type batched: bool, optional
+  :param processes: The number of worker processes used to sample tiles in parallel, tiles are sampled in this process by default.
+  :type processes: int, optional
+  :return: A generator of lists of tuples, each list containing the coordinates and configuration indices of the points in one tile.
+  :rtype: Iterator[List[Tuple[Tuple[float, float], int]]]
+  """
+  
+  if isinstance(surface, list) and surface == []:
+    return
+  geometry = surface.geometry if isinstance(surface, PreparedSurface) else PreparedSurface(surface).geometry
+  if geometry.is_empty:
+    return
+  
+  max_distance = max(max(distances) for distances in exclusion_distance_table(crown_widths))
+  if tile_size is None:
+    tile_size = 8 * max_distance if max_distance > 0 else max(geometry.bounds[2] - geometry.bounds[0], geometry.bounds[3] - geometry.bounds[1])
+  if tile_size <= 0 or tile_size < max_distance:
+    raise ValueError(f"The tile size {tile_size} must be positive and at least the largest exclusion distance {max_distance}")
+  
+  min_x, min_y, max_x, max_y = geometry.bounds
+  columns = max(1, int(np.ceil((max_x - min_x) / tile_size)))
+  rows = max(1, int(np.ceil((max_y - min_y) / tile_size)))
+  base_seed = random.getrandbits(64)
+  
+  def tile_bounds(row, column):
+    return (min_x + column * tile_size, min_y + row * tile_size, min_x + (column + 1) * tile_size, min_y + (row + 1) * tile_size)
+  
+  def tile_margins(row, column):
+    """
+    Determines the margins of a tile towards its neighbors that are sampled after it, see sample_tile.
+    """
+    
+    horizontal = max_distance if column % 2 == 0 else 0
+    return (
+      horizontal if column > 0 else 0, 0, 
+      horizontal if column < columns - 1 else 0, max_distance if row < rows - 1 else 0
+    )
+  
+  def points_near_tile(row, column, previous_row, current_row):
+    """
+    Collects the already sampled points of the neighboring tiles that are near enough to the sampled area of the tile 
+    to interact with its points.
+    """
+    
+    tile_min_x, tile_min_y, tile_max_x, tile_max_y = tile_bounds(row, column)
+    margins = tile_margins(row, column)
+    candidates = [
+      point
+      for sampled_row in (previous_row, current_row)
+      for neighbor_column in range(column - 2, column + 3)
+      for point in sampled_row.get(neighbor_column, ())
+    ]
+    return [
+      point for point in candidates
+      if tile_min_x - margins[0] - max_distance <= point[0][0] <= tile_max_x + margins[2] + max_distance 
+      and tile_min_y - margins[1] - max_distance <= point[0][1] <= tile_max_y + margins[3] + max_distance
+    ]
+  
+  executor = ProcessPoolExecutor(processes) if processes is not None and processes > 1 else None
+  try:
+    previous_row: Dict[int, List[Tuple[Tuple[float, float], int]]] = {}
+    for row in range(rows):
+      current_row: Dict[int, List[Tuple[Tuple[float, float], int]]] = {}
+      for parity in (0, 1):
+        phase_columns = list(range(parity, columns, 2))
+        jobs = [
+          (
+            geometry, tile_bounds(row, column), points_near_tile(row, column, previous_row, current_row),
+            configuration_weights, crown_widths, k, batched, 
+            int(np.random.SeedSequence([base_seed, row, column]).generate_state(1)[0]), tile_margins(row, column)
+          )
+          for column in phase_columns
+        ]
+        if executor is None:
+          results = (sample_tile(*job) for job in jobs)
+        else:
+          results = executor.map(sample_tile, *zip(*jobs)) if jobs else []
+        for column, tile_points in zip(phase_columns, results):
+          current_row[column] = tile_points
+          if tile_points:
+            yield tile_points
+      previous_row = current_row
+  finally:
+    if executor is not None:
+      executor.shutdown()
\ No newline at end of file
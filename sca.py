@@ -1,43 +1,40 @@
 from random import random,seed,expovariate
 from functools import partial
-from math import sqrt
+from math import sqrt, floor
 from time import time
 from array import array
 from typing import Callable, Union
+import os
 
+import numpy as np
+from scipy.spatial import KDTree
 from mathutils import Vector
 
-try:
-    from .utilc import closest
-except:
-    print('utilc.closest() not available, using pure python implementation instead')
-    def closest(pos, count, n, x, y, z):
-        d2 = 1e30
-        for i in range(n):
-          if count[i] > 1 : continue
-          dx, dy, dz = x-pos[i*3], y-pos[i*3+1], z-pos[i*3+2]
-          d = dx*dx + dy*dy + dz*dz
-          if d < d2:
-            d2 = d
-            ci = i
-            v = dx,dy,dz
-        return d2, ci, v
-
-try:
-    from .utilc import direction
-except:
-    print('utilc.direction() not available, using pure python implementation instead')
-    def direction(v):
-        n = len(v)//3
-        x=0
-        y=0
-        z=0
-        for i in range(n):
-            x += v[i*3  ]
-            y += v[i*3+1]
-            z += v[i*3+2]
-
-        return (x,y,z),x*x+y*y+z*z
+from .timer import Timer
+
+from .sca_kernels import py_closest, py_direction, backends
+
+backend = None
+
+def select_backend(name=None):
+    """
+    select the implementation of the closest() and direction() kernels and return its name.
+
+    If no name is given the SCA_BACKEND environment variable is used and if that isn't set either,
+    the native utilc kernels are preferred over the pure python ones.
+    """
+    global backend, closest, direction
+    if name is None:
+        name = os.environ.get('SCA_BACKEND', 'utilc' if 'utilc' in backends else 'python')
+    if name not in backends:
+        raise ValueError("SCA backend %s is not available, choose one of %s"%(name, ", ".join(backends)))
+    backend = name
+    closest, direction = backends[name]
+    return backend
+
+select_backend()
+if backend == 'python':
+    print('utilc.closest() and utilc.direction() not available, using pure python implementations instead')
 
 class Branchpoint:
 
@@ -56,6 +53,132 @@ class Branchpoint:
     def __str__(self):
         return str(self.v)+" "+str(self.parent)
         
+class EndpointGrid:
+    """A uniform hash grid of endpoint indices.
+
+    The cell size is chosen so that every endpoint within `cellsize` of a query point
+    is located in one of the 27 cells surrounding (and including) the cell of that point.
+    """
+
+    def __init__(self, cellsize):
+        self.cellsize = cellsize
+        self.cells = {}
+
+    def key(self, p):
+        s = self.cellsize
+        return floor(p[0]/s), floor(p[1]/s), floor(p[2]/s)
+
+    def add(self, epi, p):
+        self.cells.setdefault(self.key(p), set()).add(epi)
+
+    def remove(self, epi, p):
+        k = self.key(p)
+        cell = self.cells[k]
+        cell.discard(epi)
+        if len(cell) == 0:
+            del self.cells[k]
+
+    def near(self, p):
+        """return a list of the indices of all endpoints in the cells surrounding p."""
+        cx, cy, cz = self.key(p)
+        cells = self.cells
+        indices = []
+        for x in (cx-1, cx, cx+1):
+            for y in (cy-1, cy, cy+1):
+                for z in (cz-1, cz, cz+1):
+                    cell = cells.get((x, y, z))
+                    if cell is not None:
+                        indices.extend(cell)
+        return indices
+
+class SCAResult:
+    """
+    A grown tree stored as a structure of arrays.
+
+    positions   (n,3) float64 position of each branchpoint
+    parents     (n,)  int64   index of the parent of each branchpoint, -1 for a root
+    generations (n,)  int64   last generation that added a branchpoint to the subtree rooted at each branchpoint
+    connections (n,)  int64   number of branchpoints in that subtree
+    apex, shoot (n,)  int64   index of the first and second child of each branchpoint, -1 if there is none
+    endpoints   (m,3) float64 position of each endpoint
+
+    Children are always stored after their parents. Branchpoint objects are only created when branchpoints() is called.
+    """
+
+    def __init__(self, positions, parents, generations, connections, endpoints, apex=None, shoot=None):
+        self.positions = np.array(positions, dtype=np.float64).reshape(-1,3)
+        self.parents = np.array(parents, dtype=np.int64)
+        self.generations = np.array(generations, dtype=np.int64)
+        self.connections = np.array(connections, dtype=np.int64)
+        self.endpoints = np.array(endpoints, dtype=np.float64).reshape(-1,3)
+        if apex is None or shoot is None:
+            # note that we do not actually discriminate betwee apex and sideshoot, the first to connect is the apex
+            children = np.flatnonzero(self.parents >= 0)
+            childparents = self.parents[children]
+            _, first = np.unique(childparents, return_index=True)
+            apex = np.full(len(self.parents), -1, dtype=np.int64)
+            apex[childparents[first]] = children[first]
+            rest = np.ones(len(children), dtype=bool)
+            rest[first] = False
+            shoot = np.full(len(self.parents), -1, dtype=np.int64)
+            shoot[childparents[rest]] = children[rest]
+        self.apex = np.array(apex, dtype=np.int64)
+        self.shoot = np.array(shoot, dtype=np.int64)
+        self.branchpointviews = None
+
+    def __len__(self):
+        return len(self.parents)
+
+    def roots(self):
+        """return the indices of the branchpoints without a parent"""
+        return np.flatnonzero(self.parents < 0)
+
+    def subset(self, keep):
+        """
+        return a new SCAResult with only the branchpoints selected by the boolean mask keep, together with an array
+        that maps the old indices to the new ones (-1 for branchpoints that were left out).
+
+        Parents, apices and shoots that are left out are replaced by -1.
+        """
+        keep = np.asarray(keep, dtype=bool)
+        index2position = np.full(len(keep), -1, dtype=np.int64)
+        index2position[keep] = np.arange(np.count_nonzero(keep))
+        def remap(indices):
+            return np.where(indices >= 0, index2position[np.maximum(indices, 0)], -1)[keep]
+        return SCAResult(self.positions[keep], remap(self.parents), self.generations[keep], self.connections[keep],
+            self.endpoints, remap(self.apex), remap(self.shoot)), index2position
+
+    def branchpoints(self):
+        """return (and cache) the branchpoints as a list of linked Branchpoint objects"""
+        if self.branchpointviews is None:
+            bps = []
+            for bp, bpp, gen, con in zip(self.positions.tolist(), self.parents.tolist(), self.generations.tolist(), self.connections.tolist()):
+                bps.append(Branchpoint(bp, bpp if bpp >= 0 else None, gen))
+                bps[-1].connections = con # a bit of a misnomer: this is the sum of all connected children for this branchpoint
+            for bp, apex, shoot in zip(bps, self.apex.tolist(), self.shoot.tolist()):
+                bp.apex = bps[apex] if apex >= 0 else None
+                bp.shoot = bps[shoot] if shoot >= 0 else None
+            self.branchpointviews = bps
+        return self.branchpointviews
+
+def subtreeStatistics(parents, generations):
+    """
+    return for each branchpoint the last generation that added a branchpoint to the subtree it is the root of,
+    and the number of branchpoints in that subtree.
+
+    parents holds the index of the parent of each branchpoint (None or -1 for a root). Children are always stored after
+    their parents, so a single pass in reverse order accumulates both.
+    """
+    generations = list(generations)
+    connections = [1]*len(parents)
+    for bi in range(len(parents)-1, -1, -1):
+        bpp = parents[bi]
+        if bpp is not None and bpp >= 0:
+            if generations[bi] > generations[bpp]:
+                generations[bpp] = generations[bi]
+            connections[bpp] += connections[bi]
+    return generations, connections
+
 def sphere(r,p):
     r2 = r*r
     while True:
@@ -68,7 +191,7 @@ def sphere(r,p):
 class SCA:
 
   def __init__(self,NENDPOINTS = 100,d = 0.3,NBP = 2000, KILLDIST = 5, INFLUENCE = 15, SEED=42, volume: Union[Callable[[int], Vector], None] = None, TROPISM=0.0, exclude=lambda p: False,
-        startingpoints=[], apicalcontrol=0, apicalcontrolfalloff=1, apicaltiming=0):
+        startingpoints=[], apicalcontrol=0, apicalcontrolfalloff=1, apicaltiming=0, excludemany=None):
     if volume is None:
        raise ValueError("Volume function is required")
     
@@ -86,7 +209,7 @@ class SCA:
     
     self.bp = array('d')# position of the branchpoint
     self.bp.extend((0,0,0))
-    self.bpg=[0]        # last generation 'touching' this bp
+    self.bpg=[0]        # generation in which this bp was added (propagated to its ancestors after iterating)
     self.bpp=[None]     # the index of its parent
     self.bpc=array('i') # the number of connected shoots
     self.bpc.append(0)
@@ -95,13 +218,20 @@ class SCA:
     self.epb=[] # index of closest branchpoint
     self.epv=[] # normalized direction of closest bp to this ep
     self.epd=[] # distance to closest bp
+    self.bpe=[set()] # indices of the endpoints for which this bp is the closest
+    self.saturated=set() # bps that got their second shoot since the last reassignment of their endpoints
+    # spatial index of all endpoints that are not dead. A new branchpoint can only change the closest branchpoint
+    # or kill an endpoint that lies within the influence (or kill) distance, so we only need to look at endpoints
+    # in neighbouring cells. Without a meaningful influence range we fall back to scanning all endpoints.
+    gridsize = max(self.influence, self.killdistance)
+    self.epgrid = EndpointGrid(gridsize) if gridsize < 1e15 else None
     
     self.volumepoint=volume
     self.exclude=exclude
+    self.excludemany=excludemany # optional batched exclude, takes an (n,3) array and returns a boolean array
 
-    # result arrays, filled *after* iterations
-    self.branchpoints = []
-    self.endpoints = []
+    # result, filled *after* iterations
+    self.result = None
 
     endpoints = []
     endpoints.extend(self.volumepoint(n_points=NENDPOINTS))
@@ -112,19 +242,22 @@ class SCA:
         self.bp=array('d')
         self.bpp=[]
         self.bpc=array('i')
+        self.bpe=[]
         for bp in startingpoints:
             self.addBranchPoint(bp.v, -1, 0)
+        self.bpe=[set() for bi in range(len(self.bp)//3)]
+        for epi,epb in enumerate(self.epb):
+            if epb >= 0:
+                self.bpe[epb].add(epi)
+        self.reassignOrphanedEndPoints()
 
   def addBranchPoint(self, bp, pi, generation):
     self.bp.extend(tuple(bp))# even if it is passed as a vector we turn it in to a tuple to ease a later coversion to numpy
     self.bpg.append(generation)
-    ppi = pi
-    while ppi is not None:
-        self.bpg[ppi] = generation
-        ppi = self.bpp[ppi]
     self.bpp.append(pi)
     self.bpc.append(0)
     self.bpa.append(0)
+    self.bpe.append(set())
     self.bpc[pi]+=1
     bi = len(self.bp)//3-1
     # if the new branchpoint is closer than any other branchpoint it will make that endpoint point to itself
@@ -132,28 +265,31 @@ class SCA:
     # if not in the influence range it will mark the the endpoint as out of range but still store the distance
     
 
-    for epi,(ep,epd,epb) in enumerate(zip(self.ep,self.epd, self.epb)):
+    # (endpoints outside the neighbouring grid cells are beyond the influence range, so the only thing the full scan
+    # would change for them is the distance stored for an endpoint that is already out of range. That distance is
+    # never used to decide anything, so the resulting tree is identical)
+    candidates = range(len(self.ep)) if self.epgrid is None else self.epgrid.near(bp)
+    for epi in candidates:
+      epb = self.epb[epi]
       if epb != -1: # not a dead endpoint
+        ep = self.ep[epi]
         v = ep[0]-bp[0],ep[1]-bp[1],ep[2]-bp[2]
         d2= v[0]*v[0]+v[1]*v[1]+v[2]*v[2]
         d = sqrt(d2)
-        if d < epd:
+        if d < self.epd[epi]:
           if d>self.killdistance:
             self.epv[epi]= v[0]/d,v[1]/d,v[2]/d
             self.epd[epi]=d
             if d < self.influence:
-                self.epb[epi]=bi  # dead
+                self.assignEndPoint(epi, bi)
             else:
-                self.epb[epi]=-2  # too far
+                self.assignEndPoint(epi, -2)  # too far
           else:
-            self.epb[epi]=-1
+            self.assignEndPoint(epi, -1)  # dead
+            if self.epgrid is not None:
+              self.epgrid.remove(epi, ep)
     if self.bpc[pi]>1:  # a branch point with two children will not grow any new branches ...
-      for epi,epb in enumerate(self.epb):
-        if epb == pi:   # ... so any endpoint that points to this branchpoint is reassigned
-          bi, v, d = self.closestBranchPoint(self.ep[epi])
-          self.epb[epi]=bi
-          self.epv[epi]=v
-          self.epd[epi]=d
+      self.saturated.add(pi)  # ... so any endpoint that points to this branchpoint will be reassigned (see reassignOrphanedEndPoints())
     # update apical control factors
     self.bpa[pi] += 1
     
@@ -163,12 +299,73 @@ class SCA:
     self.epb.append(bi)
     self.epv.append(v)
     self.epd.append(d)
+    if bi >= 0:
+      self.bpe[bi].add(len(self.ep)-1)
+    if self.epgrid is not None:
+      self.epgrid.add(len(self.ep)-1, self.ep[-1])
+
+  def assignEndPoint(self, epi, bi):
+    """make endpoint epi point to branchpoint bi (or mark it as dead (-1) or out of range (-2))"""
+    epb = self.epb[epi]
+    if epb >= 0:
+      self.bpe[epb].discard(epi)
+    if bi >= 0:
+      self.bpe[bi].add(epi)
+    self.epb[epi] = bi
 
   def closestBranchPoint(self, p):
     d2, bbi, bv = closest(self.bp, self.bpc, len(self.bp)//3, p[0], p[1], p[2])
     d=sqrt(d2)
     return bbi if d < self.influence else -2, (bv[0]/d,bv[1]/d,bv[2]/d), d
 
+  def reassignOrphanedEndPoints(self):
+    """
+    reassign the endpoints that point to a branchpoint that got its second shoot to their closest non saturated branchpoint.
+
+    Instead of scanning all branchpoints for each orphaned endpoint, all endpoints orphaned in a generation are resolved
+    with a single query against a KD-tree of the non saturated branchpoints. Endpoints that got closer to a newer
+    branchpoint in the meantime will already have been reassigned by addBranchPoint(), and because the closest
+    non saturated branchpoint doesn't depend on the order in which the branchpoints were added, the result is
+    the same as reassigning them immediately.
+    """
+    orphans = sorted(epi for pi in self.saturated for epi in self.bpe[pi])
+    self.saturated = set()
+    if len(orphans) == 0:
+      return
+    available = np.flatnonzero(np.array(self.bpc) <= 1)
+    if len(available) == 0:
+      candidates = [None]*len(orphans)
+    else:
+      # all branchpoints that are (almost) as close as the closest one are candidates, so ties can be broken
+      # exactly like closest() does, i.e. in favour of the lowest index
+      kdtree = KDTree(np.array(self.bp).reshape(-1,3)[available])
+      points = np.array([self.ep[epi] for epi in orphans])
+      d, _ = kdtree.query(points)
+      candidates = kdtree.query_ball_point(points, d*(1+1e-9)+1e-12)
+    bp = self.bp
+    for epi, nearest in zip(orphans, candidates):
+      if nearest is None:
+        bi, v, d = self.closestBranchPoint(self.ep[epi])
+      else:
+        # recompute the distances exactly like closest() so the result doesn't depend on the KD-tree's arithmetic
+        p = self.ep[epi]
+        d2 = 1e30
+        for bi in sorted(available[nearest].tolist()):
+          dx, dy, dz = p[0]-bp[bi*3], p[1]-bp[bi*3+1], p[2]-bp[bi*3+2]
+          dd = dx*dx + dy*dy + dz*dz
+          if dd < d2:
+            d2 = dd
+            ci = bi
+            v = dx,dy,dz
+        bi = ci
+        d = sqrt(d2)
+        v = v[0]/d, v[1]/d, v[2]/d
+        if d >= self.influence:
+          bi = -2
+      self.assignEndPoint(epi, bi)
+      self.epv[epi]=v
+      self.epd[epi]=d
+
   def shootSupressed(self, apicalcontrolfactor):
     """returns true if a growing shoot should be supressed """
     if self.apicalcontrol <= 0 :
@@ -197,7 +394,7 @@ class SCA:
     for bpi in bis:
       if self.shootSupressed(self.bpa[bpi]) : continue # don't grow a branch if apical control is to strong
       
-      epvs = array('d',[c for epi,v in enumerate(self.epv) if self.epb[epi]==bpi for c in v])
+      epvs = array('d',[c for epi in sorted(self.bpe[bpi]) for c in self.epv[epi]])
       # the direction of the new branchpoint is the average of the normalized directions to the closest endpoints
       # (normalizing the direction will give them all equal weight).
 
@@ -207,9 +404,14 @@ class SCA:
 
       newbps.append((self.bp[bpi*3]+vd[0], self.bp[bpi*3+1]+vd[1], self.bp[bpi*3+2]+vd[2]+self.tropism ))
       newbpps.append(bpi)
-    for newbp,newbpp in zip(newbps,newbpps):
-      if not self.exclude(Vector(newbp)):
+    if self.excludemany is not None:
+      excluded = self.excludemany(newbps)
+    else:
+      excluded = [self.exclude(Vector(newbp)) for newbp in newbps]
+    for newbp,newbpp,isexcluded in zip(newbps,newbpps,excluded):
+      if not isexcluded:
         self.addBranchPoint(newbp, newbpp, generation)
+    self.reassignOrphanedEndPoints()
 
   def nodeRelocation(self):
     """move the branchpoints halfway to their parent"""
@@ -230,9 +432,11 @@ class SCA:
     niterations=0.0
     newendpointsper1000 /= 1000.0
     t=expovariate(newendpointsper1000) if newendpointsper1000 > 0.0 else 1 # time to the first new 'endpoint add event'
+    self.timings = Timer() # time spent per generation
 
     for i in range(self.maxiterations):
         self.growBranches(i)
+        self.timings.add('generation %d'%i)
         if maxtime>0 and time()-starttime>maxtime: break
         if newendpointsper1000 > 0.0:
             # generate new endpoints with a poisson process
@@ -252,27 +456,195 @@ class SCA:
 
     # self.nodeRelocation()
 
-    self.branchpoints=[]
-    for bi in range(len(self.bp)//3):
-        bp = self.bp[bi*3], self.bp[bi*3+1], self.bp[bi*3+2]
-        bpp= self.bpp[bi]
-        gen= self.bpg[bi]
-        self.branchpoints.append(Branchpoint(bp, bpp, gen))
-        # note that we do not actually discriminate betwee apex and sideshoot, the first to connect is the apex
-        if bpp is not None:
-            parent = self.branchpoints[bpp]
-            if parent.apex is None:
-                parent.apex = self.branchpoints[-1]
-            else:
-                parent.shoot = self.branchpoints[-1]
-    
-    for bp in self.branchpoints:
-        bpp = bp
-        while bpp.parent is not None:
-            bpp = self.branchpoints[bpp.parent]
-            bpp.connections += 1 # a bit of a misnomer: this is the sum of all connected children for this branchpoint
-        
-    self.endpoints=[]
-    for ep in self.ep:
-        self.endpoints.append(Vector(ep))
-    #print('endpoints',len(self.endpoints))    
\ No newline at end of file
+    # the generation of a branchpoint is the last generation 'touching' it, i.e. that added a branchpoint to its subtree
+    generations, connections = subtreeStatistics(self.bpp, self.bpg)
+    parents = [bpp if bpp is not None else -1 for bpp in self.bpp]
+    self.result = SCAResult(self.bp, parents, generations, connections, self.ep)
+
+  @property
+  def branchpoints(self):
+    """the grown branchpoints as Branchpoint objects, built on demand from self.result"""
+    return [] if self.result is None else self.result.branchpoints()
+
+  @property
+  def endpoints(self):
+    """the endpoints as Vectors, built on demand from self.result"""
+    return [] if self.result is None else [Vector(ep) for ep in self.result.endpoints.tolist()]
+
+class NumpySCA(SCA):
+  """
+  A vectorized variant of the SCA class with the same constructor and iterate() contract.
+
+  Branchpoints and endpoints are kept in contiguous float64 arrays and each generation is processed as a batch:
+  all new branchpoints of a generation are added at once, after which the closest branchpoint of every endpoint,
+  the endpoints that are killed and the growth directions are computed with array operations. Because the new
+  branchpoints of a generation are inserted together rather than one by one the resulting tree is not identical
+  to the one produced by SCA, but it is grown according to the same rules.
+  """
+
+  def __init__(self,NENDPOINTS = 100,d = 0.3,NBP = 2000, KILLDIST = 5, INFLUENCE = 15, SEED=42, volume: Union[Callable[[int], Vector], None] = None, TROPISM=0.0, exclude=lambda p: False,
+        startingpoints=[], apicalcontrol=0, apicalcontrolfalloff=1, apicaltiming=0, excludemany=None):
+    if volume is None:
+       raise ValueError("Volume function is required")
+
+    self.killdistance = KILLDIST
+    self.branchlength = d
+    self.maxiterations = NBP
+    self.tropism = TROPISM
+    self.influence = INFLUENCE if INFLUENCE > 0 else 1e16
+    self.apicalcontrol = apicalcontrol
+    self.apicalcontrolfalloff = apicalcontrolfalloff
+    self.apicaltiming = apicaltiming
+    self.apicalstep = apicalcontrol / apicaltiming if apicaltiming > 0 else 0.0
+
+    seed(SEED)
+
+    self.bp = np.zeros((1,3))               # position of the branchpoints
+    self.bpg = np.zeros(1, dtype=np.int64)  # generation in which the branchpoint was added
+    self.bpp = np.full(1, -1, dtype=np.int64) # the index of its parent, -1 for a root
+    self.bpc = np.zeros(1, dtype=np.int64)  # the number of connected shoots
+    self.bpa = np.zeros(1, dtype=np.int64)  # the apical control factor
+    self.ep = np.zeros((0,3))               # position of the endpoints
+    self.epb = np.zeros(0, dtype=np.int64)  # index of closest branchpoint, -1 if dead, -2 if out of range
+    self.epv = np.zeros((0,3))              # normalized direction of closest bp to this ep
+    self.epd = np.zeros(0)                  # distance to closest bp
+
+    self.volumepoint=volume
+    self.exclude=exclude
+    self.excludemany=excludemany # optional batched exclude, takes an (n,3) array and returns a boolean array
+
+    # result, filled *after* iterations
+    self.result = None
+
+    if len(startingpoints)>0:
+      self.bp = np.array([tuple(bp.v) for bp in startingpoints], dtype=np.float64).reshape(-1,3)
+      n = len(self.bp)
+      self.bpg = np.zeros(n, dtype=np.int64)
+      self.bpp = np.full(n, -1, dtype=np.int64)
+      self.bpc = np.zeros(n, dtype=np.int64)
+      self.bpa = np.zeros(n, dtype=np.int64)
+
+    self.addEndPoints(self.volumepoint(n_points=NENDPOINTS))
+
+  def addBranchPoint(self, bp, pi, generation):
+    self.addBranchPoints(np.array([tuple(bp)]), np.array([pi]), generation)
+
+  def addBranchPoints(self, bps, pis, generation):
+    """add a batch of new branchpoints, each grown from a different parent branchpoint."""
+    n = len(self.bp)
+    k = len(bps)
+    if k == 0:
+      return
+    self.bp = np.concatenate((self.bp, bps))
+    self.bpg = np.concatenate((self.bpg, np.full(k, generation, dtype=np.int64)))
+    self.bpp = np.concatenate((self.bpp, pis))
+    self.bpc = np.concatenate((self.bpc, np.zeros(k, dtype=np.int64)))
+    self.bpa = np.concatenate((self.bpa, np.zeros(k, dtype=np.int64)))
+    np.add.at(self.bpc, pis, 1)
+    np.add.at(self.bpa, pis, 1)
+
+    # the closest new branchpoint will make an endpoint point to itself if it is closer than the current one,
+    # or mark it as dead if it is within kill distance. As the distance to the closest branchpoint only ever decreases,
+    # an endpoint is killed if any of the new branchpoints is within kill distance.
+    alive = np.flatnonzero(self.epb != -1)
+    if len(alive) > 0:
+      d, nearest = KDTree(bps).query(self.ep[alive])
+      closer = d < self.epd[alive]
+      killed = closer & (d <= self.killdistance)
+      self.epb[alive[killed]] = -1
+      update = closer & ~killed
+      epi = alive[update]
+      d = d[update]
+      self.epv[epi] = (self.ep[epi] - bps[nearest[update]]) / d[:,None]
+      self.epd[epi] = d
+      self.epb[epi] = np.where(d < self.influence, n + nearest[update], -2)
+
+    # a branchpoint with two children will not grow any new branches, so any endpoint that points to it is reassigned
+    saturated = self.bpc > 1
+    orphans = np.flatnonzero((self.epb >= 0) & saturated[np.maximum(self.epb, 0)])
+    if len(orphans) > 0:
+      self.epb[orphans], self.epv[orphans], self.epd[orphans] = self.closestBranchPoints(self.ep[orphans])
+
+  def addEndPoint(self, ep):
+    self.addEndPoints([ep])
+
+  def addEndPoints(self, eps):
+    eps = np.array([tuple(ep) for ep in eps], dtype=np.float64).reshape(-1,3)
+    bi, v, d = self.closestBranchPoints(eps)
+    self.ep = np.concatenate((self.ep, eps))
+    self.epb = np.concatenate((self.epb, bi))
+    self.epv = np.concatenate((self.epv, v))
+    self.epd = np.concatenate((self.epd, d))
+
+  def closestBranchPoint(self, p):
+    bi, v, d = self.closestBranchPoints(np.array([tuple(p)]))
+    return int(bi[0]), tuple(v[0]), float(d[0])
+
+  def closestBranchPoints(self, points):
+    """return the index of, normalized direction from and distance to the closest non saturated branchpoint for each point."""
+    available = np.flatnonzero(self.bpc <= 1)
+    if len(available) == 0 or len(points) == 0:
+      return np.full(len(points), -2, dtype=np.int64), np.zeros((len(points),3)), np.full(len(points), 1e30)
+    d, nearest = KDTree(self.bp[available]).query(points)
+    bi = available[nearest]
+    v = (points - self.bp[bi]) / np.maximum(d, 1e-30)[:,None]
+    return np.where(d < self.influence, bi, -2), v, d
+
+  def growBranches(self, generation):
+    # we iterate over all branchpoints that actually have endpoints that are closest to them
+    active = self.epb >= 0
+    bis = np.unique(self.epb[active])
+    if self.apicalcontrol > 0:
+      bis = np.array([bpi for bpi in bis if not self.shootSupressed(self.bpa[bpi])], dtype=np.int64)
+    if len(bis) == 0:
+      return
+    # the direction of the new branchpoint is the average of the normalized directions to the closest endpoints
+    # (normalizing the direction will give them all equal weight).
+    v = np.zeros((len(self.bp),3))
+    np.add.at(v, self.epb[active], self.epv[active])
+    v = v[bis]
+    d = np.sqrt(np.einsum('ij,ij->i', v, v))
+    grows = d > 0
+    bis = bis[grows]
+    newbps = self.bp[bis] + v[grows] * (self.branchlength / d[grows])[:,None]
+    newbps[:,2] += self.tropism
+    if self.excludemany is not None:
+      keep = ~np.asarray(self.excludemany(newbps), dtype=bool)
+    else:
+      keep = np.array([not self.exclude(Vector(newbp)) for newbp in newbps], dtype=bool)
+    self.addBranchPoints(newbps[keep], bis[keep], generation)
+
+  def nodeRelocation(self):
+    """move the branchpoints halfway to their parent"""
+    parents = np.where(self.bpp >= 0, self.bpp, np.arange(len(self.bpp)))
+    self.bp = (self.bp + self.bp[parents]) / 2.0
+
+  def iterate(self, newendpointsper1000=0, maxtime=0.0):
+    starttime=time()
+    niterations=0.0
+    newendpointsper1000 /= 1000.0
+    t=expovariate(newendpointsper1000) if newendpointsper1000 > 0.0 else 1 # time to the first new 'endpoint add event'
+    self.timings = Timer() # time spent per generation
+
+    for i in range(self.maxiterations):
+        self.growBranches(i)
+        self.timings.add('generation %d'%i)
+        if maxtime>0 and time()-starttime>maxtime: break
+        if newendpointsper1000 > 0.0:
+            # generate new endpoints with a poisson process
+            niterations+=1
+            nnew = 0
+            while t < niterations:
+                nnew += 1
+                t+=expovariate(newendpointsper1000)
+            if nnew > 0:
+                self.addEndPoints(self.volumepoint(n_points=nnew))
+        # reduce apical control
+        if self.apicaltiming > 0:
+            self.apicaltiming -=1
+            self.apicalcontrol -= self.apicalstep
+            if self.apicalcontrol < 0 :
+                self.apicalcontrol = 0.0
+
+    generations, connections = subtreeStatistics(self.bpp.tolist(), self.bpg.tolist())
+    self.result = SCAResult(self.bp, self.bpp, generations, connections, self.ep)
\ No newline at end of file
@@ -0,0 +1,39 @@
+"""
+The closest() and direction() kernels of the space colonization algorithm, see select_backend in sca.py.
+
+This module does not import Blender modules, so the native kernels can be compared with the pure python ones without Blender.
+"""
+
+def py_closest(pos, count, n, x, y, z):
+    d2 = 1e30
+    ci = -1
+    v = 0.0,0.0,0.0
+    for i in range(n):
+      if count[i] > 1 : continue
+      dx, dy, dz = x-pos[i*3], y-pos[i*3+1], z-pos[i*3+2]
+      d = dx*dx + dy*dy + dz*dz
+      if d < d2:
+        d2 = d
+        ci = i
+        v = dx,dy,dz
+    return d2, ci, v
+
+def py_direction(v):
+    n = len(v)//3
+    x=0
+    y=0
+    z=0
+    for i in range(n):
+        x += v[i*3  ]
+        y += v[i*3+1]
+        z += v[i*3+2]
+
+    return (x,y,z),x*x+y*y+z*z
+
+# the kernels that are available, the native ones are only present if the utilc extension was built (see setup_utilc.py)
+backends = {'python': (py_closest, py_direction)}
+try:
+    from . import utilc
+    backends['utilc'] = (utilc.closest, utilc.direction)
+except ImportError:
+    pass
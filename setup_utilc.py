@@ -0,0 +1,18 @@
+"""
+Builds the utilc extension module that provides native versions of the closest() and direction() kernels in sca.py.
+
+Usage (from this directory, with the python interpreter that Blender uses):
+
+  python setup_utilc.py build_ext --inplace
+"""
+
+import os
+from setuptools import setup, Extension
+
+# don't let the compiler fuse multiplies and adds, so the results are bit identical to the pure python kernels
+extra_compile_args = [] if os.name == 'nt' else ['-O2', '-ffp-contract=off']
+
+setup(
+  name="utilc",
+  ext_modules=[Extension("utilc", sources=["utilc.c"], extra_compile_args=extra_compile_args)],
+)
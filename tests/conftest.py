@@ -0,0 +1,49 @@
+"""
+Shared helpers for the tests of the Blender Forest Simulator addon.
+
+The addon's __init__.py registers Blender operators, so the modules under test are imported into a bare package
+that points at the addon directory instead of importing the addon itself.
+Outside of Blender, bpy and bmesh are replaced by minimal stand-ins so the modules can be imported and their NumPy code
+tested, anything that creates Blender data still needs Blender.
+Run them from the addon directory with: python -m pytest tests
+"""
+
+import os
+import sys
+import types
+import importlib
+
+ADDON_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADDON_PACKAGE = "forest_simulator_addon"
+
+
+def install_blender_stubs():
+    """Register stand-ins for the bpy and bmesh modules if they can not be imported."""
+    try:
+        import bpy  # noqa: F401
+        import bmesh  # noqa: F401
+        return
+    except ImportError:
+        pass
+
+    handlers = types.ModuleType("bpy.app.handlers")
+    handlers.persistent = lambda function: function
+    handlers.depsgraph_update_post = []
+    app = types.ModuleType("bpy.app")
+    app.background = False
+    app.handlers = handlers
+    bpy = types.ModuleType("bpy")
+    bpy.app = app
+    sys.modules.update({"bpy": bpy, "bpy.app": app, "bpy.app.handlers": handlers, "bmesh": types.ModuleType("bmesh")})
+
+
+install_blender_stubs()
+
+
+def import_addon_module(name):
+    """Import a module of the addon, e.g. "sca", without running the addon's __init__.py."""
+    if ADDON_PACKAGE not in sys.modules:
+        package = types.ModuleType(ADDON_PACKAGE)
+        package.__path__ = [ADDON_PATH]
+        sys.modules[ADDON_PACKAGE] = package
+    return importlib.import_module(f"{ADDON_PACKAGE}.{name}")
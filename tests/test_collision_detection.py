@@ -0,0 +1,52 @@
+"""
+The two detectors of colliding trees in VoxelGrid.evaluate_forest, the KD-tree of tree positions and the sparse
+occupancy grid, must schedule the same pairs and therefore produce the same forest for the same seed.
+"""
+
+import json
+import os
+import random
+
+import numpy as np
+import pytest
+
+from conftest import ADDON_PATH, import_addon_module
+
+voxel_grid_module = import_addon_module("voxel_grid")
+
+
+def load_configurations():
+    names = ["columnar_tree.json", "sphere_tree.json", "spreading_tree.json"]
+    configurations = []
+    for name in names:
+        with open(os.path.join(ADDON_PATH, "tree_configs", name)) as file:
+            configurations.append(json.load(file))
+    return configurations
+
+
+def generate(seed, use_occupancy):
+    random.seed(seed)
+    voxel_grid = voxel_grid_module.VoxelGrid()
+    voxel_grid.generate_forest(load_configurations(), [1, 1, 1], [(0, 0), (40, 0), (40, 40), (0, 40)], use_occupancy=use_occupancy)
+    return voxel_grid
+
+
+def test_occupancy_grid_reports_every_owner_of_a_shared_cell():
+    occupancy = voxel_grid_module.SparseOccupancyGrid(chunk_size=4)
+    assert occupancy.add(0, np.array([[0, 0, 0], [5, 5, 5]])) == set()
+    assert occupancy.add(1, np.array([[0, 0, 0], [-3, 2, 1]])) == {(0, 1)}
+    assert occupancy.add(2, np.array([[0, 0, 0]])) == {(0, 2), (1, 2)}
+    assert occupancy.add(3, np.array([[-3, 2, 1], [9, 9, 9]])) == {(1, 3)}
+    assert occupancy.add(4, np.empty((0, 3), dtype=int)) == set()
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_detectors_produce_the_same_forest(seed):
+    default = generate(seed, use_occupancy=False)
+    occupancy = generate(seed, use_occupancy=True)
+    assert default.collision_statistics == occupancy.collision_statistics
+    assert default.collision_statistics["resolved"] > 0
+    assert len(default.trees) == len(occupancy.trees)
+    for default_tree, occupancy_tree in zip(default.trees, occupancy.trees):
+        assert default_tree[:4] == occupancy_tree[:4]
+        assert np.array_equal(default_tree[-1], occupancy_tree[-1])
@@ -0,0 +1,89 @@
+"""
+Parity of VoxelGrid.capture_boxes, the array based greedy box merger, with the reference implementation capture_quads.
+Both must return the same set of boxes of the crown cells of a tree grid, only their order may differ.
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from conftest import ADDON_PATH, import_addon_module
+
+voxel_grid_module = import_addon_module("voxel_grid")
+CROWN = voxel_grid_module.CellType.crown.value
+
+
+def boxes_of(tree_grid):
+    """The boxes found by capture_quads and capture_boxes for a single tree with the given grid."""
+    voxel_grid = voxel_grid_module.VoxelGrid()
+    voxel_grid.trees.append((0, 0, 0, 0, tree_grid))
+    return voxel_grid.capture_quads(0), voxel_grid.capture_boxes(0)
+
+
+def assert_same_boxes(tree_grid):
+    quads, boxes = boxes_of(tree_grid)
+    assert len(boxes) == len(set(boxes))
+    assert sorted(quads) == sorted(boxes)
+
+
+def checkerboard(shape):
+    x, y, z = np.indices(shape)
+    return np.where((x + y + z) % 2 == 0, CROWN, 0).astype(np.int8)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_random_grids(seed):
+    rng = np.random.default_rng(seed)
+    shape = tuple(rng.integers(1, 12, size=3))
+    density = rng.uniform(0.05, 0.95)
+    # crown cells mixed with the other cell types, which are not meshed
+    tree_grid = np.where(rng.random(shape) < density, CROWN, rng.choice([0, 1, 3], size=shape)).astype(np.int8)
+    assert_same_boxes(tree_grid)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_blocky_grids(seed):
+    # unions of random boxes, which have long runs that merge over several rows and layers
+    rng = np.random.default_rng(seed)
+    shape = tuple(rng.integers(4, 16, size=3))
+    tree_grid = np.zeros(shape, dtype=np.int8)
+    for _ in range(rng.integers(1, 6)):
+        start = rng.integers(0, shape)
+        end = start + rng.integers(1, shape)
+        tree_grid[start[0]:end[0], start[1]:end[1], start[2]:end[2]] = CROWN
+    assert_same_boxes(tree_grid)
+
+
+def test_empty_grid():
+    quads, boxes = boxes_of(np.zeros((5, 6, 7), dtype=np.int8))
+    assert quads == [] and boxes == []
+
+
+def test_full_grid():
+    quads, boxes = boxes_of(np.full((5, 6, 7), CROWN, dtype=np.int8))
+    assert quads == boxes == [(0, 0, 0, 4, 5, 6)]
+
+
+def test_single_voxel():
+    tree_grid = np.zeros((5, 6, 7), dtype=np.int8)
+    tree_grid[2, 3, 4] = CROWN
+    quads, boxes = boxes_of(tree_grid)
+    assert quads == boxes == [(2, 3, 4, 2, 3, 4)]
+
+
+@pytest.mark.parametrize("shape", [(1, 1, 1), (2, 2, 2), (5, 4, 3), (8, 8, 8)])
+def test_checkerboard(shape):
+    tree_grid = checkerboard(shape)
+    quads, boxes = boxes_of(tree_grid)
+    assert sorted(quads) == sorted(boxes)
+    assert len(boxes) == np.count_nonzero(tree_grid)
+
+
+@pytest.mark.parametrize("file_name", ["columnar_tree.json", "sphere_tree.json", "spreading_tree.json"])
+def test_tree_configurations(file_name):
+    with open(os.path.join(ADDON_PATH, "tree_configs", file_name)) as tree_config_json:
+        tree_configuration = json.load(tree_config_json)
+    tree_grid = voxel_grid_module.VoxelGrid().create_tree_grid(tree_configuration)
+    assert_same_boxes(tree_grid)
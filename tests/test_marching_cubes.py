@@ -0,0 +1,76 @@
+"""
+Tests of VoxelGrid.marching_cubes_mesh, the optional smooth surface of a tree crown, and of sampling it.
+"""
+
+import numpy as np
+import pytest
+
+from conftest import import_addon_module
+
+voxel_grid_module = import_addon_module("voxel_grid")
+CROWN = voxel_grid_module.CellType.crown.value
+
+
+def grid_of(tree_grid):
+    voxel_grid = voxel_grid_module.VoxelGrid()
+    voxel_grid.trees.append((0, 0, 0, 0, tree_grid))
+    return voxel_grid
+
+
+def mesh_of(tree_grid, step_size, smoothing):
+    return grid_of(tree_grid).marching_cubes_mesh(0, step_size=step_size, smoothing=smoothing)
+
+
+def sphere_grid():
+    x, y, z = np.indices((20, 20, 20)) - 9.5
+    return np.where(x * x + y * y + z * z < 64, CROWN, 0).astype(np.int8)
+
+
+def signed_volume(vertices, faces):
+    corners = vertices[faces]
+    return np.einsum('ij,ij->i', corners[:, 0], np.cross(corners[:, 1], corners[:, 2])).sum() / 6
+
+
+@pytest.mark.parametrize("step_size, smoothing", [(1, 0.0), (2, 0.0), (3, 0.0), (4, 0.5), (2, 1.0)])
+def test_thin_crown(step_size, smoothing):
+    # a single crown cell is missed by the strided samples of most step sizes
+    tree_grid = np.zeros((6, 6, 6), dtype=np.int8)
+    tree_grid[3, 3, 3] = CROWN
+    vertices, faces = mesh_of(tree_grid, step_size, smoothing)
+    assert len(faces) > 0
+    assert signed_volume(vertices, faces) > 0
+
+
+def test_empty_crown():
+    vertices, faces = mesh_of(np.zeros((6, 6, 6), dtype=np.int8), 2, 1.0)
+    assert vertices.shape == (0, 3) and faces.shape == (0, 3)
+
+
+@pytest.mark.parametrize("step_size", [1, 2])
+def test_closed_outward_surface(step_size):
+    vertices, faces = mesh_of(sphere_grid(), step_size, 1.0)
+
+    # every edge of a closed surface is shared by exactly two triangles in opposite directions
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    assert len({tuple(edge) for edge in edges.tolist()}) == len(edges)
+    assert {tuple(edge) for edge in edges.tolist()} == {tuple(edge) for edge in edges[:, ::-1].tolist()}
+    assert signed_volume(vertices, faces) > 0
+
+
+def test_smooth_samples_lie_on_the_surface():
+    voxel_grid = grid_of(sphere_grid())
+    vertices, _ = voxel_grid.marching_cubes_mesh(0)
+    center = vertices.mean(axis=0)
+    radii = np.linalg.norm(vertices - center, axis=1)
+
+    points = voxel_grid.sample_crown_surface(0, 500, seed=3, smooth=True)
+    assert points.shape == (500, 3)
+    assert np.array_equal(points, voxel_grid.sample_crown_surface(0, 500, seed=3, smooth=True))
+    # the triangles are small, so points on them are about as far from the center as their corners
+    distances = np.linalg.norm(points - center, axis=1)
+    assert radii.min() - 0.5 < distances.min() and distances.max() < radii.max() + 0.5
+
+
+def test_smooth_samples_of_an_empty_crown():
+    points = grid_of(np.zeros((6, 6, 6), dtype=np.int8)).sample_crown_surface(0, 10, smooth=True)
+    assert points.shape == (0, 3)
@@ -0,0 +1,53 @@
+"""
+The tiled Poisson disk sampler must not change the density of the points near the borders between tiles,
+compared with sampling the whole surface at once.
+"""
+
+import random
+
+import numpy as np
+
+from conftest import import_addon_module
+
+poisson_disk_sampling = import_addon_module("poisson_disk_sampling")
+
+SIDE = 120
+TILE_SIZE = 20
+CROWN_WIDTHS = [4.0, 6.0, 8.0]
+WEIGHTS = [1, 1, 1]
+SURFACE = [(0, 0), (SIDE, 0), (SIDE, SIDE), (0, SIDE)]
+
+
+def points_near_tile_borders(points, distance=1.0):
+    """Counts the points within the given distance of a border between two tiles, away from the border of the surface."""
+    positions = np.array([point[0] for point in points])
+    to_border = np.abs(positions - np.round(positions / TILE_SIZE) * TILE_SIZE).min(axis=1)
+    inside = np.all((positions > TILE_SIZE / 2) & (positions < SIDE - TILE_SIZE / 2), axis=1)
+    return np.count_nonzero(inside & (to_border < distance))
+
+
+def test_tile_borders_keep_the_density_of_the_untiled_sampler():
+    untiled = 0
+    tiled = 0
+    for seed in range(4):
+        random.seed(seed)
+        untiled += points_near_tile_borders(
+            poisson_disk_sampling.poisson_disk_sampling_on_surface(SURFACE, WEIGHTS, CROWN_WIDTHS)
+        )
+        random.seed(seed)
+        tiles = poisson_disk_sampling.poisson_disk_sampling_tiles(SURFACE, WEIGHTS, CROWN_WIDTHS, tile_size=TILE_SIZE)
+        tiled += points_near_tile_borders([point for tile in tiles for point in tile])
+    # tiles that packed their points against their borders or seeded next to the points of their neighbors gave about 20% more
+    assert 0.92 < tiled / untiled < 1.08
+
+
+def test_tiles_keep_their_distance_across_borders():
+    random.seed(0)
+    tiles = poisson_disk_sampling.poisson_disk_sampling_tiles(SURFACE, WEIGHTS, CROWN_WIDTHS, tile_size=TILE_SIZE)
+    points = [point for tile in tiles for point in tile]
+    positions = np.array([point[0] for point in points])
+    configurations = np.array([point[1] for point in points])
+    exclusion_distances = np.asarray(poisson_disk_sampling.exclusion_distance_table(CROWN_WIDTHS))
+    distances = np.linalg.norm(positions[:, np.newaxis] - positions[np.newaxis], axis=2)
+    np.fill_diagonal(distances, np.inf)
+    assert np.all(distances > exclusion_distances[configurations[:, np.newaxis], configurations[np.newaxis]])
@@ -0,0 +1,75 @@
+"""
+Parity of the native utilc kernels with the pure python kernels in sca_kernels.py.
+
+setup_utilc.py builds utilc with -ffp-contract=off, so both backends must return bit identical results.
+The tests are skipped if utilc is not built (python setup_utilc.py build_ext --inplace).
+"""
+
+import random
+from array import array
+
+import numpy as np
+import pytest
+
+from conftest import import_addon_module
+
+sca_kernels = import_addon_module("sca_kernels")
+if "utilc" not in sca_kernels.backends:
+    pytest.skip("the utilc extension is not built", allow_module_level=True)
+
+py_closest, py_direction = sca_kernels.py_closest, sca_kernels.py_direction
+c_closest, c_direction = sca_kernels.backends["utilc"]
+
+
+def random_positions(rng, size):
+    """Random positions as a flat array of doubles, spread over several orders of magnitude."""
+    return array('d', (rng.uniform(-1, 1) * 10 ** rng.randint(-3, 3) for _ in range(3 * size)))
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_closest_matches_python(seed):
+    rng = random.Random(seed)
+    size = rng.randint(1, 200)
+    pos = random_positions(rng, size)
+    count = array('i', (rng.randint(0, 3) for _ in range(size)))
+    n = rng.randint(0, size)
+    x, y, z = (rng.uniform(-10, 10) for _ in range(3))
+
+    assert c_closest(pos, count, n, x, y, z) == py_closest(pos, count, n, x, y, z)
+
+
+@pytest.mark.parametrize("count_type", ['b', 'h', 'i', 'q'])
+def test_closest_accepts_integer_buffers(count_type):
+    rng = random.Random(1)
+    pos = random_positions(rng, 100)
+    count = array(count_type, (rng.randint(0, 2) for _ in range(100)))
+
+    assert c_closest(pos, count, 100, 0.5, -0.25, 2.0) == py_closest(pos, count, 100, 0.5, -0.25, 2.0)
+    assert c_closest(np.array(pos), np.array(count), 100, 0.5, -0.25, 2.0) == py_closest(pos, count, 100, 0.5, -0.25, 2.0)
+
+
+def test_closest_without_candidates():
+    rng = random.Random(2)
+    pos = random_positions(rng, 50)
+    count = array('i', [2] * 50)
+
+    result = c_closest(pos, count, 50, 1.0, 2.0, 3.0)
+    assert result == py_closest(pos, count, 50, 1.0, 2.0, 3.0)
+    assert result[1] == -1
+    assert c_closest(pos, count, 0, 1.0, 2.0, 3.0)[1] == -1
+
+
+def test_closest_rejects_too_large_n():
+    pos = array('d', [0.0] * 6)
+    count = array('i', [0, 0])
+
+    with pytest.raises(IndexError):
+        c_closest(pos, count, 3, 0.0, 0.0, 0.0)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_direction_matches_python(seed):
+    rng = random.Random(seed)
+    v = random_positions(rng, rng.randint(0, 200))
+
+    assert c_direction(v) == py_direction(v)
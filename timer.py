@@ -12,6 +12,11 @@ class Timer:
 		"add a new labeled timestamp"
 		self.od[label]=time()
 
+	def durations(self):
+		"return a list of (label, seconds since the previous timestamp) tuples in order of addition."
+		keys=list(self.od.keys())
+		return [(keys[i], self.od[keys[i]]-self.od[keys[i-1]]) for i in range(1,len(keys))]
+
 	def __str__(self):
 		"print a list of timings in order of addition. Second column is time since start."
 		keys=list(self.od.keys())
@@ -22,7 +22,7 @@
 # for first time
 import sys
 
-from .endpoint_sampling import sample_mesh_group_surface_points
+from .endpoint_sampling import sample_mesh_group_surface_points, get_mesh_surface, get_mesh_triangles, transform_triangles
 sys.path.append("C:\\users\\anton\\appdata\\roaming\\python\\python39\\site-packages")
 
 bl_info = {
@@ -46,10 +46,11 @@ import numpy as np
 import bpy
 from bpy.props import FloatProperty, IntProperty, BoolProperty, EnumProperty
 from mathutils import Vector,Euler,Matrix,Quaternion
+from mathutils.bvhtree import BVHTree
 from scipy.spatial import KDTree
 import bmesh
 
-from .sca import SCA, Branchpoint # the core class that implements the space colonization algorithm and the definition of a segment
+from .sca import SCA, NumpySCA, SCAResult, Branchpoint # the core class that implements the space colonization algorithm and the definition of a segment
 from .timer import Timer
 from .utils import load_materials_from_bundled_lib, load_particlesettings_from_bundled_lib, get_vertex_group
 from .voxel_grid import VoxelGrid
@@ -156,6 +157,70 @@ def insidegroup(pointrelativetocursor, group):
       return True
   return False
 
+class GroupExclusion():
+  """
+  Tests if points relative to the 3D cursor lie inside any mesh of a group, like insidegroup.
+  The meshes are transformed to world space and put in one BVH tree per mesh once, so no matrix is inverted
+  and no object ray cast is needed per test. Points outside the bounding box of a mesh skip its ray casts.
+  Like the object ray casts of pointInsideMesh, the meshes are tested with their modifiers and shape keys applied.
+  """
+  
+  def __init__(self, group):
+    self.cursor = np.array(bpy.context.scene.cursor.location)
+    self.meshes = [] # bounding box minimum, maximum and BVH tree of every mesh in world space
+    if group not in bpy.data.collections : return
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    for ob in bpy.data.collections.get(group).objects:
+      if not isinstance(ob.data, bpy.types.Mesh): continue
+      triangles = self.evaluatedTriangles(ob, depsgraph)
+      if len(triangles) == 0: continue
+      triangles = transform_triangles(triangles, ob.matrix_world)
+      vertices = triangles.reshape(-1,3)
+      bvh = BVHTree.FromPolygons(vertices.tolist(), np.arange(len(vertices)).reshape(-1,3).tolist(), all_triangles=True)
+      self.meshes.append((vertices.min(axis=0), vertices.max(axis=0), bvh))
+  
+  @staticmethod
+  def evaluatedTriangles(ob, depsgraph):
+    """return the triangles of the evaluated mesh of an object in local space"""
+    if len(ob.modifiers) == 0 and ob.data.shape_keys is None:
+      # the evaluated mesh is the mesh itself, so the cached triangles can be used
+      triangles, _ = get_mesh_surface(ob.data)
+      return triangles
+    evaluated = ob.evaluated_get(depsgraph)
+    try:
+      return get_mesh_triangles(evaluated.to_mesh())
+    finally:
+      evaluated.to_mesh_clear()
+  
+  def __call__(self, pointrelativetocursor):
+    return bool(self.insidePoints([tuple(pointrelativetocursor)])[0])
+  
+  def insidePoints(self, pointsrelativetocursor):
+    """return a boolean array that is True for every point that lies inside any mesh of the group"""
+    points = np.asarray(pointsrelativetocursor, dtype=np.float64).reshape(-1,3) + self.cursor
+    inside = np.zeros(len(points), dtype=bool)
+    for minimum, maximum, bvh in self.meshes:
+      candidates = np.flatnonzero(~inside & (points >= minimum).all(axis=1) & (points <= maximum).all(axis=1))
+      for i in candidates:
+        inside[i] = self.rayParity(bvh, Vector(points[i]))
+    return inside
+  
+  @staticmethod
+  def rayParity(bvh, orig, maxdistance=10000.0, maxcrossings=1000):
+    # same test as pointInsideMesh: an odd number of crossings along +Z means the point is inside.
+    # the ray ends maxdistance above the point and counts at most maxcrossings hits, so rays that keep hitting
+    # coplanar or degenerate triangles terminate
+    count = 0
+    axis=Vector((0,0,1))
+    top = orig.z + maxdistance
+    while count < maxcrossings:
+      location,normal,index,distance = bvh.ray_cast(orig,axis,top-orig.z)
+      if index is None: break
+      count += 1
+      # step past the hit by at least the single precision resolution of mathutils at this height
+      orig = location + axis*max(0.00001, abs(location.z)*1e-6)
+    return count%2 == 1
+
 def groupdistribution(crowngroup,shadowgroup=None,shadowdensity=0.5, seed=0,size=Vector((1,1,1)),pointrelativetocursor=Vector((0,0,0))):
   if crowngroup == shadowgroup:
     shadowgroup = None # safeguard otherwise every marker would be rejected
@@ -188,13 +253,16 @@ def groupdistribution(crowngroup,shadowgroup=None,shadowdensity=0.5, seed=0,size
       nyield+=1
       yield v
 
-def surface_based_groupdistribution(crowngroup, n_points=1000, seed=0, size=Vector((1,1,1)), pointrelativetocursor=Vector((0,0,0))):
+def surface_based_groupdistribution(crowngroup, n_points=1000, seed=0, size=Vector((1,1,1)), pointrelativetocursor=Vector((0,0,0)), worldspace=False):
     """Generate points on mesh surfaces instead of checking if points are inside"""
     
     # Pre-generate surface points for crown group
     crown_surface_points = []
     if crowngroup in bpy.data.collections:
-        crown_surface_points = sample_mesh_group_surface_points(crowngroup, n_points, seed)
+        crown_surface_points = sample_mesh_group_surface_points(crowngroup, n_points, seed, world_space=worldspace)
+        if worldspace:
+            # the endpoints are relative to the cursor, where the tree is grown
+            crown_surface_points = crown_surface_points - np.array(bpy.context.scene.cursor.location)
     
     return crown_surface_points
     
@@ -228,7 +296,8 @@ def createMarkers(tree,scale=0.05):
   tetraeder = [v * scale for v in tetraeder]
   tfaces = [(0,1,2),(0,1,3),(1,2,3),(0,3,2)]
   
-  for eip,ep in enumerate(tree.endpoints):
+  for eip,ep in enumerate(tree.result.endpoints.tolist()):
+    ep = Vector(ep)
     verts.extend([ep + v for v in tetraeder])
     n=len(faces)
     faces.extend([(f1+n,f2+n,f3+n) for f1,f2,f3 in tfaces])
@@ -238,71 +307,63 @@ def createMarkers(tree,scale=0.05):
   mesh.update(calc_edges=True)
   return mesh
 
-def basictri(bp, verts, radii, power, scale, p):
-  v = bp.v + p
+def basictri(result, bpi, verts, radii, power, scale, p):
+  v = Vector(result.positions[bpi]) + p
   nv = len(verts)
-  r=(bp.connections**power)*scale
+  connections = int(result.connections[bpi])
+  r=(connections**power)*scale
   a=-r
   b=r*0.5   # cos(60)
   c=r*0.866 # sin(60)
   verts.extend([v+Vector((a,0,0)), v+Vector((b,-c,0)), v+Vector((b,c,0))]) # provisional, should become an optimally rotated triangle
-  radii.extend([bp.connections,bp.connections,bp.connections])
+  radii.extend([connections,connections,connections])
   return (nv, nv+1, nv+2)
   
-def _simpleskin(bp, loop, verts, faces, radii, power, scale, p):
-  newloop = basictri(bp, verts, radii, power, scale, p)
+def _simpleskin(result, bpi, loop, verts, faces, radii, power, scale, p):
+  newloop = basictri(result, bpi, verts, radii, power, scale, p)
   for i in range(3):
     faces.append((loop[i],loop[(i+1)%3],newloop[(i+1)%3],newloop[i]))
-  if bp.apex:
-    _simpleskin(bp.apex, newloop, verts, faces, radii, power, scale, p)
-  if bp.shoot:
-    _simpleskin(bp.shoot, newloop, verts, faces, radii, power, scale, p)
+  if result.apex[bpi] >= 0:
+    _simpleskin(result, result.apex[bpi], newloop, verts, faces, radii, power, scale, p)
+  if result.shoot[bpi] >= 0:
+    _simpleskin(result, result.shoot[bpi], newloop, verts, faces, radii, power, scale, p)
   
-def simpleskin(bp, verts, faces, radii, power, scale, p):
-  loop = basictri(bp, verts, radii, power, scale, p)
-  if bp.apex:
-    _simpleskin(bp.apex, loop, verts, faces, radii, power, scale, p)
-  if bp.shoot:
-    _simpleskin(bp.shoot, loop, verts, faces, radii, power, scale, p)
+def simpleskin(result, bpi, verts, faces, radii, power, scale, p):
+  loop = basictri(result, bpi, verts, radii, power, scale, p)
+  if result.apex[bpi] >= 0:
+    _simpleskin(result, result.apex[bpi], loop, verts, faces, radii, power, scale, p)
+  if result.shoot[bpi] >= 0:
+    _simpleskin(result, result.shoot[bpi], loop, verts, faces, radii, power, scale, p)
 
 #TODO: Make it better than just random
-def leafnode(bp, verts, faces, radii, p1, p2, scale=0.0001):
-  loop1 = basictri(bp, verts, radii, 0.0, scale, p1)
-  loop2 = basictri(bp, verts, radii, 0.0, scale, p2)
+def leafnode(result, bpi, verts, faces, radii, p1, p2, scale=0.0001):
+  loop1 = basictri(result, bpi, verts, radii, 0.0, scale, p1)
+  loop2 = basictri(result, bpi, verts, radii, 0.0, scale, p2)
   # if random() > random_threshold:
   #   for i in range(3):
   #     faces.append((loop1[i],loop1[(i+1)%3],loop2[(i+1)%3],loop2[i]))
   for i in range(3):
     faces.append((loop1[i],loop1[(i+1)%3],loop2[(i+1)%3],loop2[i]))
-  if bp.apex:
-    leafnode(bp.apex, verts, faces, radii, p1, p2, scale)
-  if bp.shoot:
-    leafnode(bp.shoot, verts, faces, radii, p1, p2, scale)
+  if result.apex[bpi] >= 0:
+    leafnode(result, result.apex[bpi], verts, faces, radii, p1, p2, scale)
+  if result.shoot[bpi] >= 0:
+    leafnode(result, result.shoot[bpi], verts, faces, radii, p1, p2, scale)
 
-def createLeaves2(tree, roots, p, scale):
+def createLeaves2(result, roots, p, scale):
   verts = []
   faces = []
   radii = []
   for r in roots:
-    leafnode(r, verts, faces, radii, p, p++Vector((0,0, scale)), scale)
+    leafnode(result, r, verts, faces, radii, p, p++Vector((0,0, scale)), scale)
   mesh = bpy.data.meshes.new('LeafEmitter')
   mesh.from_pydata(verts, [], faces)
   mesh.update(calc_edges=True)
   return mesh, verts, faces, radii
 
-def pruneTree(tree, generation):
-  nbp = []
-  i2p = {}
-  #print()
-  for i,bp in enumerate(tree):
-    #print(i, bp.v, bp.generation, bp.parent, end='')
-    if bp.generation >= generation:
-      #print(' keep', end='')
-      bp.index = i
-      i2p[i] = len(nbp)
-      nbp.append(bp)
-    #print()
-  return nbp, i2p
+def pruneTree(result, generation):
+  """return an SCAResult with only the branchpoints that were touched in or after the given generation,
+  together with an array that maps the original indices to the new ones (-1 if pruned)."""
+  return result.subset(result.generations >= generation)
   
 def force_blender_cleanup():
   """
@@ -384,24 +445,21 @@ def createGeometry(tree, power=0.5, scale=0.01,
   radii=[]
   roots=set()
   
-  # prune if requested
-  tree.branchpoints, index2position = pruneTree(tree.branchpoints, prune)
-  if len(tree.branchpoints) < 2:
+  # prune if requested (the parents in the pruned result already refer to positions in the pruned result)
+  result, index2position = pruneTree(tree.result, prune)
+  if len(result) < 2:
     return None
   # Loop over all branchpoints and create connected edges
   #print('\ngenerating skeleton')
   
-  for n,bp in enumerate(tree.branchpoints):
-    #print(n, bp.index, bp.v, bp.generation, bp.parent)
-    verts.append(bp.v+p)
-    radii.append(bp.connections)
-    if not (bp.parent is None) :
-      #print(bp.parent,index2position[bp.parent])
-      edges.append((len(verts)-1,index2position[bp.parent]))
+  for n,(bpv,bpp,connections) in enumerate(zip(result.positions.tolist(), result.parents.tolist(), result.connections.tolist())):
+    verts.append(Vector(bpv)+p)
+    radii.append(connections)
+    if bpp >= 0 :
+      edges.append((len(verts)-1,bpp))
     else :
       nv=len(verts)
-      roots.add(bp)
-    bp.index=n
+      roots.add(n)
     
   timings.add('skeleton')
   
@@ -409,7 +467,7 @@ def createGeometry(tree, power=0.5, scale=0.01,
   if nomodifiers == False and skinmethod == 'NATIVE': 
     # add a quad edge loop to all roots
     for r in roots:
-      simpleskin(r, verts, faces, radii, power, scale, p)
+      simpleskin(result, r, verts, faces, radii, power, scale, p)
       
   # end of native skinning section
   timings.add('nativeskin')
@@ -476,14 +534,14 @@ def createGeometry(tree, power=0.5, scale=0.01,
   timings.add('modifiers')
   # create a particles based leaf emitter (if we have leaves and/or objects)
   # bpy.context.scene.objects.active = obj_new
-  obj_processed = segmentIntoTrunkAndBranch(tree, obj_new, (np.array(radii)**power)*scale)
+  obj_processed = segmentIntoTrunkAndBranch(result, obj_new, (np.array(radii)**power)*scale)
   bpy.ops.object.shade_smooth()
 
   obj_processed["class_id"] = class_id
   obj_processed.name = f"Tree_{obj_processed['class_id']}"
   
   if leafParticles != 'None' or objectParticles != 'None':
-    mesh, verts, faces, radii = createLeaves2(tree, roots, Vector((0,0,0)), emitterscale)
+    mesh, verts, faces, radii = createLeaves2(result, roots, Vector((0,0,0)), emitterscale)
     obj_leaves2 = bpy.data.objects.new(mesh.name, mesh)
     base = bpy.context.collection.objects.link(obj_leaves2)
     obj_leaves2.parent = obj_processed
@@ -705,7 +763,7 @@ def createGeometry(tree, power=0.5, scale=0.01,
   return obj_processed
 
 # This method is currently not being used.
-def add_leaves_to_tree(tree, leave_nodes, obj_new):
+def add_leaves_to_tree(result, leave_nodes, obj_new):
   # Create a new mesh for the leaves
   leaf_mesh = bpy.data.meshes.new("Leaves")
   leaf_verts = []
@@ -714,8 +772,9 @@ def add_leaves_to_tree(tree, leave_nodes, obj_new):
   # uv_layer = leaf_mesh.loops.layers.uv.new()
   
   for leave_node in leave_nodes:
-    pos = leave_node.v
-    direction = (pos - tree.branchpoints[leave_node.parent].v).normalized() if leave_node.parent is not None else Vector((0, 0, 1))
+    pos = Vector(result.positions[leave_node])
+    parent = result.parents[leave_node]
+    direction = (pos - Vector(result.positions[parent])).normalized() if parent >= 0 else Vector((0, 0, 1))
 
     # First quad
     v1 = Vector((-0.1,-0.1,0))
@@ -788,21 +847,21 @@ def add_leaves_to_tree(tree, leave_nodes, obj_new):
   # Parent the leaves to the tree object
   leaf_obj.parent = obj_new
 
-def segmentIntoTrunkAndBranch(tree, obj_new, radii):
-  top = find_top_of_trunk(tree.branchpoints)
+def segmentIntoTrunkAndBranch(result, obj_new, radii):
+  top = find_top_of_trunk(result)
       
-  trunk_nodes = [top]
-  trunk_indices = [top.index]
+  trunk_indices = [top]
 
-  while trunk_nodes[-1].parent is not None:  
-    trunk_nodes.append(tree.branchpoints[trunk_nodes[-1].parent])
-    trunk_indices.append(trunk_nodes[-1].index)
+  while result.parents[trunk_indices[-1]] >= 0:  
+    trunk_indices.append(int(result.parents[trunk_indices[-1]]))
     
+  trunk = np.zeros(len(result), dtype=bool)
+  trunk[trunk_indices] = True
 
-  trunk_node_positions = [trunk_node.v for trunk_node in trunk_nodes]
-  branch_node_positions = [bp.v for bp in tree.branchpoints if bp not in trunk_nodes and bp.apex is not None]
-  leave_nodes = [bp for bp in tree.branchpoints if bp not in trunk_nodes and bp.apex is None]
-  branch_node_indices = [i for i in range(len(tree.branchpoints)) if i not in trunk_indices]
+  trunk_node_positions = result.positions[trunk_indices]
+  branch_node_positions = result.positions[~trunk & (result.apex >= 0)]
+  leave_nodes = np.flatnonzero(~trunk & (result.apex < 0))
+  branch_node_indices = np.flatnonzero(~trunk)
 
   trunk_material = create_material("TrunkMaterial", (0.77, 0.64, 0.52, 1), 2) # light brown
   branch_material = create_material("BranchMaterial", (0.36, 0.25, 0.20, 1), 3) # dark brown
@@ -841,28 +900,16 @@ def segmentIntoTrunkAndBranch(tree, obj_new, radii):
   
   return obj_new
 
-def create_inverse_graph(branchpoints):
-  node_to_children = {}
-  for bp in branchpoints:
-    if bp.parent is not None:
-      if bp.parent not in node_to_children:
-        node_to_children[bp.parent] = []
-      node_to_children[bp.parent].append(bp.index)
-  return node_to_children
-
-def find_top_of_trunk(branchpoints):
-  node_to_children = create_inverse_graph(branchpoints)
-  candidate = branchpoints[0]
-  queue = node_to_children[0]
-  while len(queue) > 0:
-    current_index = queue.pop(0)
-    current_node = branchpoints[current_index]
-    if (current_node.parent is not None 
-        and branchpoints[current_node.parent].shoot != current_node):
-      if current_node.connections < candidate.connections:
-        candidate = current_node
-      queue.extend(node_to_children.get(current_index, []))
-  return candidate
+def find_top_of_trunk(result):
+  """return the index of the top of the trunk, the branchpoint with the fewest connections when following the apex
+  of each branchpoint upward from the root."""
+  candidate = 0
+  current = result.apex[0]
+  while current >= 0:
+    if result.connections[current] < result.connections[candidate]:
+      candidate = current
+    current = result.apex[current]
+  return int(candidate)
 
 def create_material(name, color, pass_index):
   mat = bpy.data.materials.get(name)
@@ -887,6 +934,12 @@ def assign_vertices_to_group(obj, group_name, vertex_indices):
     group = obj.vertex_groups[group_name]
   group.add(vertex_indices, 1.0, 'ADD')
 
+# the available implementations of the space colonization algorithm, selectable with the scaEngine parameter
+sca_engines = {
+  'python': SCA,
+  'numpy': NumpySCA
+}
+
 class SCATree():
 
   def __init__(self, 
@@ -899,6 +952,8 @@ class SCATree():
               scale=0.01,
               useGroups=False,
               crownGroup='None',
+              crownSampler=None,
+              crownWorldSpace=False,
               shadowGroup='None',
               shadowDensity=0.5,
               exclusionGroup='None',
@@ -927,6 +982,7 @@ class SCATree():
               apicalcontrol=0.0,
               apicalcontrolfalloff=1.0,
               apicalcontroltiming=10,
+              scaEngine='python',
               context=None,
               ):
     self.class_id = class_id
@@ -938,6 +994,8 @@ class SCATree():
     self.scale = scale
     self.useGroups = useGroups
     self.crownGroup = crownGroup
+    self.crownSampler = crownSampler
+    self.crownWorldSpace = crownWorldSpace
     self.shadowGroup = shadowGroup
     self.shadowDensity = shadowDensity
     self.exclusionGroup = exclusionGroup
@@ -977,6 +1035,9 @@ class SCATree():
     self.apicalcontrol = apicalcontrol   
     self.apicalcontrolfalloff = apicalcontrolfalloff 
     self.apicalcontroltiming = apicalcontroltiming    
+    if scaEngine not in sca_engines:
+      raise ValueError("scaEngine must be one of %s, got %s"%(", ".join(sca_engines), scaEngine))
+    self.scaEngine = scaEngine
 
   def create_tree(self, context):
     # if not self.updateTree:
@@ -1009,10 +1070,13 @@ class SCATree():
       pass
       
 
-    if self.useGroups:
+    if self.crownSampler is not None:
+      # endpoints are sampled directly, e.g. from the crown cells of the voxel grid, relative to the cursor
+      volumefie=partial(self.crownSampler,seed=self.randomSeed)
+    elif self.useGroups:
       size,minp = groupExtends(self.crownGroup)
       # volumefie=partial(groupdistribution,self.crownGroup,self.shadowGroup,self.shadowDensity,self.randomSeed,size,minp-bpy.context.scene.cursor.location)
-      volumefie=partial(surface_based_groupdistribution,crowngroup=self.crownGroup,seed=self.randomSeed,size=size,pointrelativetocursor=minp-bpy.context.scene.cursor.location)
+      volumefie=partial(surface_based_groupdistribution,crowngroup=self.crownGroup,seed=self.randomSeed,size=size,pointrelativetocursor=minp-bpy.context.scene.cursor.location,worldspace=self.crownWorldSpace)
     else:
       volumefie=partial(ellipsoid2,self.crownSize*self.crownShape,self.crownSize,Vector((0,0,self.crownSize+self.crownOffset)),self.surfaceBias,self.topBias)
       
@@ -1023,8 +1087,11 @@ class SCATree():
           p = ob.location - context.scene.cursor.location
           startingpoints.append(Branchpoint(p,None, 0))
       
+    # built once per tree, the exclusion group does not change while the tree grows
+    exclusion = GroupExclusion(self.exclusionGroup)
+    
     timings.add('scastart')
-    sca = SCA(NBP = self.maxIterations,
+    sca = sca_engines[self.scaEngine](NBP = self.maxIterations,
       NENDPOINTS=self.numberOfEndpoints,
       d=self.internodeLength,
       KILLDIST=self.killDistance,
@@ -1032,7 +1099,8 @@ class SCATree():
       SEED=self.randomSeed,
       TROPISM=self.tropism,
       volume=volumefie,
-      exclude=lambda p: insidegroup(p, self.exclusionGroup),
+      exclude=exclusion,
+      excludemany=exclusion.insidePoints,
       startingpoints=startingpoints,
       apicalcontrol=self.apicalcontrol,
       apicalcontrolfalloff=self.apicalcontrolfalloff,
@@ -1042,6 +1110,11 @@ class SCATree():
           
     sca.iterate(newendpointsper1000=self.newEndPointsPer1000,maxtime=self.maxTime)
     timings.add('iterate')
+    if self.timePerformance:
+      generationtimes = [d for _,d in sca.timings.durations()]
+      if len(generationtimes) > 0:
+        print("%-20s: %d generations, mean %.4fs, max %.4fs"%('sca generations', len(generationtimes),
+          sum(generationtimes)/len(generationtimes), max(generationtimes)))
     
     if self.showMarkers:
       mesh = createMarkers(sca, self.markerScale)
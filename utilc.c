@@ -0,0 +1,142 @@
+/*
+ * Native implementations of the closest() and direction() kernels used by sca.py.
+ *
+ * Both functions accept any object that exposes a C contiguous buffer, e.g. array.array or numpy arrays,
+ * so the arrays maintained by the SCA class can be passed without copying.
+ *
+ * Build in place with:  python setup_utilc.py build_ext --inplace
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <string.h>
+
+/* get a contiguous buffer and check that its items are of one of the given struct formats */
+static int get_buffer(PyObject *obj, Py_buffer *view, const char *formats, const char *name)
+{
+    const char *format;
+
+    if (PyObject_GetBuffer(obj, view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0)
+        return -1;
+    format = view->format ? view->format : "B";
+    if (format[0] == '@' || format[0] == '=' || format[0] == '<')
+        format++;
+    if (strlen(format) != 1 || strchr(formats, format[0]) == NULL) {
+        PyErr_Format(PyExc_TypeError, "%s: unsupported item format '%s'", name, view->format);
+        PyBuffer_Release(view);
+        return -1;
+    }
+    return 0;
+}
+
+/* read item i of an integer buffer, regardless of its item size */
+static long long int_item(const Py_buffer *view, Py_ssize_t i)
+{
+    switch (view->itemsize) {
+    case 1: return ((const signed char *)view->buf)[i];
+    case 2: return ((const short *)view->buf)[i];
+    case 4: return ((const int *)view->buf)[i];
+    default: return ((const long long *)view->buf)[i];
+    }
+}
+
+PyDoc_STRVAR(closest_doc,
+"closest(pos, count, n, x, y, z) -> (d2, index, (dx, dy, dz))\n\n"
+"Return the squared distance, index and vector to (x, y, z) of the closest of the first n points in pos\n"
+"(a flat buffer of doubles) whose count is at most 1. index is -1 if there is no such point.");
+
+static PyObject *closest(PyObject *self, PyObject *args)
+{
+    PyObject *pos_obj, *count_obj;
+    Py_buffer pos, count;
+    Py_ssize_t n, i, ci = -1;
+    double x, y, z, d2 = 1e30, vx = 0.0, vy = 0.0, vz = 0.0;
+    const double *p;
+
+    if (!PyArg_ParseTuple(args, "OOnddd", &pos_obj, &count_obj, &n, &x, &y, &z))
+        return NULL;
+    if (get_buffer(pos_obj, &pos, "d", "pos") < 0)
+        return NULL;
+    if (get_buffer(count_obj, &count, "bhilqBHILQ", "count") < 0) {
+        PyBuffer_Release(&pos);
+        return NULL;
+    }
+    if (n < 0 || n * 3 > pos.len / (Py_ssize_t)sizeof(double) || n > count.len / count.itemsize) {
+        PyBuffer_Release(&pos);
+        PyBuffer_Release(&count);
+        PyErr_SetString(PyExc_IndexError, "closest: n exceeds the size of pos or count");
+        return NULL;
+    }
+
+    p = (const double *)pos.buf;
+    Py_BEGIN_ALLOW_THREADS
+    for (i = 0; i < n; i++) {
+        double dx, dy, dz, d;
+        if (int_item(&count, i) > 1)
+            continue;
+        dx = x - p[i*3];
+        dy = y - p[i*3+1];
+        dz = z - p[i*3+2];
+        d = dx*dx + dy*dy + dz*dz;
+        if (d < d2) {
+            d2 = d;
+            ci = i;
+            vx = dx;
+            vy = dy;
+            vz = dz;
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&pos);
+    PyBuffer_Release(&count);
+    return Py_BuildValue("dn(ddd)", d2, ci, vx, vy, vz);
+}
+
+PyDoc_STRVAR(direction_doc,
+"direction(v) -> ((x, y, z), length2)\n\n"
+"Return the sum of the 3D vectors stored in the flat buffer of doubles v and its squared length.");
+
+static PyObject *direction(PyObject *self, PyObject *args)
+{
+    PyObject *v_obj;
+    Py_buffer v;
+    Py_ssize_t n, i;
+    double x = 0.0, y = 0.0, z = 0.0;
+    const double *p;
+
+    if (!PyArg_ParseTuple(args, "O", &v_obj))
+        return NULL;
+    if (get_buffer(v_obj, &v, "d", "v") < 0)
+        return NULL;
+
+    n = v.len / (Py_ssize_t)sizeof(double) / 3;
+    p = (const double *)v.buf;
+    for (i = 0; i < n; i++) {
+        x += p[i*3];
+        y += p[i*3+1];
+        z += p[i*3+2];
+    }
+
+    PyBuffer_Release(&v);
+    return Py_BuildValue("(ddd)d", x, y, z, x*x + y*y + z*z);
+}
+
+static PyMethodDef utilc_methods[] = {
+    {"closest", closest, METH_VARARGS, closest_doc},
+    {"direction", direction, METH_VARARGS, direction_doc},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef utilc_module = {
+    PyModuleDef_HEAD_INIT,
+    "utilc",
+    "Native kernels for the space colonization algorithm.",
+    -1,
+    utilc_methods
+};
+
+PyMODINIT_FUNC PyInit_utilc(void)
+{
+    return PyModule_Create(&utilc_module);
+}
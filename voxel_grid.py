@@ -6,9 +6,15 @@ from enum import Enum
 from skimage.measure import marching_cubes
 from typing import Tuple, List, Dict, Set, Any
 from scipy.spatial import KDTree
-from scipy.ndimage import distance_transform_edt
+from scipy.ndimage import distance_transform_edt, gaussian_filter
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+from concurrent.futures import ProcessPoolExecutor
 
-from .poisson_disk_sampling import poisson_disk_sampling_on_surface
+from .poisson_disk_sampling import poisson_disk_sampling_on_surface, poisson_disk_sampling_tiles
+from .endpoint_sampling import get_triangle_areas, sample_triangles
 
 class CellType(Enum):
   no_tree = 0
@@ -16,6 +22,127 @@ class CellType(Enum):
   crown = 2
   collision = 3
 
+class SparseOccupancyGrid:
+  """
+  A sparse occupancy grid in world voxel coordinates that records which trees claimed a voxel.
+  The world is divided into cubic chunks and only the chunks that contain filled voxels are allocated as small dense
+  blocks. The further owners of voxels claimed by more than one tree are kept per chunk as well.
+  It is only used to detect the pairs of trees whose crowns share a voxel before they are resolved, the tree grids remain
+  the storage of the trees, so the claims are not updated when a collision clears cells and the grid is discarded afterwards.
+  """
+  
+  def __init__(self, chunk_size: int = 8):
+    """
+    :param chunk_size: The edge length of a chunk in voxels.
+    :type chunk_size: int
+    """
+    
+    self.chunk_size = chunk_size
+    # chunk coordinates to the owner of every voxel in the chunk, -1 marks an empty voxel
+    self.chunks: Dict[Tuple[int, int, int], np.ndarray] = {}
+    # chunk coordinates to an array of shape (m, 2) with the flat local index and a further owner of shared voxels
+    self.shared_cells: Dict[Tuple[int, int, int], np.ndarray] = {}
+  
+  def add(self, owner: int, cells: np.ndarray) -> Set[Tuple[int, int]]:
+    """
+    Claims the given world voxels for an owner and detects the voxels that were already claimed by other owners.
+    
+    :param owner: The non-negative identifier of the owner, e.g. the index of a tree.
+    :type owner: int
+    :param cells: A numpy array of shape (n, 3) with the world voxel coordinates.
+    :type cells: np.ndarray
+    :return: The pairs (smaller owner, larger owner) of the owners that collide with the given owner.
+    :rtype: Set[Tuple[int, int]]
+    """
+    
+    colliding_owners: Set[int] = set()
+    if len(cells) == 0:
+      return set()
+    
+    chunk_coordinates = cells // self.chunk_size
+    local_cells = cells - chunk_coordinates * self.chunk_size
+    # group the cells by chunk with a linear chunk index within their bounding box, so every chunk is visited once
+    first_chunk = chunk_coordinates.min(axis=0)
+    chunk_extent = chunk_coordinates.max(axis=0) - first_chunk + 1
+    chunk_indices = np.ravel_multi_index((chunk_coordinates - first_chunk).T, chunk_extent)
+    order = np.argsort(chunk_indices, kind='stable')
+    sorted_indices = chunk_indices[order]
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(sorted_indices)) + 1, [len(sorted_indices)]))
+    
+    for chunk_index in range(len(bounds) - 1):
+      chunk = chunk_coordinates[order[bounds[chunk_index]]]
+      key = tuple(int(c) for c in chunk)
+      block = self.chunks.get(key)
+      if block is None:
+        block = np.full((self.chunk_size,) * 3, -1, dtype=np.int32)
+        self.chunks[key] = block
+      
+      chunk_cells = local_cells[order[bounds[chunk_index]:bounds[chunk_index + 1]]]
+      previous_owners = block[chunk_cells[:, 0], chunk_cells[:, 1], chunk_cells[:, 2]]
+      free = previous_owners == -1
+      block[chunk_cells[free, 0], chunk_cells[free, 1], chunk_cells[free, 2]] = owner
+      
+      claimed = ~free & (previous_owners != owner)
+      if not np.any(claimed):
+        continue
+      colliding_owners.update(np.unique(previous_owners[claimed]).tolist())
+      
+      claimed_indices = np.ravel_multi_index(chunk_cells[claimed].T, block.shape)
+      shared = self.shared_cells.get(key)
+      new_shared = np.stack((claimed_indices, np.full(len(claimed_indices), owner)), axis=1)
+      if shared is None:
+        self.shared_cells[key] = new_shared
+      else:
+        colliding_owners.update(np.unique(shared[np.isin(shared[:, 0], claimed_indices), 1]).tolist())
+        self.shared_cells[key] = np.concatenate((shared, new_shared))
+    
+    colliding_owners.discard(owner)
+    return {(min(owner, other), max(owner, other)) for other in colliding_owners}
+
+def can_fork_workers() -> bool:
+  """
+  Checks if collisions can be resolved in worker processes. The workers are forked, so they inherit the loaded modules
+  instead of importing bpy again, which rules out Windows. A forked Blender session with a user interface would also 
+  share its window and GPU state with the workers, so they are only used when Blender runs in background mode (blender -b).
+  
+  :return: True if worker processes can be used.
+  :rtype: bool
+  """
+  
+  return "fork" in multiprocessing.get_all_start_methods() and bpy.app.background
+
+def resolve_collision_batch(shared_memory_name: str, layout: Dict[int, Tuple[int, int, int, int, int, Tuple[int, int, int]]], pairs: List[Tuple[int, int, int]]):
+  """
+  Resolves a batch of collisions between trees whose grids are stored in shared memory.
+  This is a module level function, so it can run in a worker process. The pairs of a batch must not share trees with the
+  pairs that are resolved at the same time in other processes.
+  
+  :param shared_memory_name: The name of the shared memory block containing all tree grids.
+  :type shared_memory_name: str
+  :param layout: For every tree in the shared memory block its position, configuration index, byte offset and grid shape.
+  :type layout: Dict[int, Tuple[int, int, int, int, int, Tuple[int, int, int]]]
+  :param pairs: The indices of the two trees of every collision and the seed used for resolving it.
+  :type pairs: List[Tuple[int, int, int]]
+  :return: The number of pairs skipped by the bounding box test, the number of pairs without shared crown voxels and the 
+    number of pairs resolved, see VoxelGrid.collision_statistics.
+  :rtype: Dict[str, int]
+  """
+  
+  shared_memory = SharedMemory(name=shared_memory_name)
+  try:
+    trees = {}
+    for index in {index for pair in pairs for index in pair[:2]}:
+      x, y, z, configuration_index, offset, shape = layout[index]
+      tree_grid = np.ndarray(shape, dtype=np.int8, buffer=shared_memory.buf, offset=offset)
+      trees[index] = (x, y, z, configuration_index, tree_grid)
+    voxel_grid = VoxelGrid()
+    voxel_grid.resolve_collisions(trees, pairs)
+    # the views must not outlive the mapping
+    del trees, tree_grid
+    return voxel_grid.collision_statistics
+  finally:
+    shared_memory.close()
+
 class VoxelGrid:
   """
   The class used to manage trees in a simulated forest.
@@ -33,6 +160,20 @@ class VoxelGrid:
     self.trees: List[Tuple[int, int, int, int, np.ndarray]] = []
 
     self.cube_size = 0.5
+    
+    # (configuration values, cube size) to the read-only grid shared by all trees of that configuration,
+    # a tree only gets its own copy of the grid once a collision modifies it
+    self.shape_templates: Dict[Tuple[Tuple[Tuple[str, str], ...], float], np.ndarray] = {}
+    
+    # tree index to the world voxel bounding box (inclusive minimum, exclusive maximum) of its crown, 
+    # or None if it has no crown cells. Entries are shrunk or removed when the cells of the tree change.
+    self.crown_boxes: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+    # the number of pairs of trees skipped by the bounding box test, the number of pairs whose boxes overlap without 
+    # sharing crown voxels and the number of pairs actually resolved in the last evaluation
+    self.collision_statistics = {"skipped": 0, "disjoint": 0, "resolved": 0}
+    
+    # if False, the distances of collision cells are computed on the complete tree grids instead of a box around them
+    self.restrict_distance_transform = True
 
   def generate_mesh(self, index):  
     crown_mesh = self.generate_crown_mesh(index)
@@ -108,7 +249,7 @@ class VoxelGrid:
       return False 
     return tree_grid[x][y][z] == CellType.crown.value
       
-  def generate_forest(self, tree_configurations: List[Dict[str, Any]], configuration_weights: List[float], surface: List[Tuple[int, int]]):
+  def generate_forest(self, tree_configurations: List[Dict[str, Any]], configuration_weights: List[float], surface: List[Tuple[int, int]], tile_size: float = None, processes: int = None, use_occupancy: bool = False, collision_processes: int = None):
     """
     Generates a forest by placing trees on a surface based on specified configurations and weights.
     
@@ -124,22 +265,37 @@ class VoxelGrid:
     :type configuration_weights: List[float]
     :param surface: A list of tuples representing the surface points where trees can be placed.
     :type surface: List[Tuple[int, int]]
+    :param tile_size: If given, the surface is sampled in tiles of this size and the trees of a tile are added 
+      while the next tiles are still being sampled.
+    :type tile_size: float, optional
+    :param processes: The number of processes used to sample tiles in parallel when sampling in tiles.
+    :type processes: int, optional
+    :param use_occupancy: If True, colliding trees are found with a sparse world occupancy grid, see evaluate_forest.
+    :type use_occupancy: bool, optional
+    :param collision_processes: The number of processes used to resolve collisions, see evaluate_forest.
+    :type collision_processes: int, optional
     :return: None
     """
     
     
     crown_widths = [tree_configuration["crown_width"] for tree_configuration in tree_configurations]
-    sampled_points = poisson_disk_sampling_on_surface(surface, configuration_weights, crown_widths)
-    for sampled_point in sampled_points:
-      sampled_position = sampled_point[0]
-      chosen_configuration_index = sampled_point[1]
-      self.add_tree((sampled_position[0], sampled_position[1], 0), chosen_configuration_index, tree_configurations[chosen_configuration_index])
-    self.evaluate_forest(tree_configurations)
+    if tile_size is None:
+      sampled_tiles = [poisson_disk_sampling_on_surface(surface, configuration_weights, crown_widths)]
+    else:
+      sampled_tiles = poisson_disk_sampling_tiles(surface, configuration_weights, crown_widths, tile_size=tile_size, processes=processes)
+    for sampled_points in sampled_tiles:
+      for sampled_point in sampled_points:
+        sampled_position = sampled_point[0]
+        chosen_configuration_index = sampled_point[1]
+        self.add_tree((sampled_position[0], sampled_position[1], 0), chosen_configuration_index, tree_configurations[chosen_configuration_index])
+    self.evaluate_forest(tree_configurations, use_occupancy, collision_processes)
     self.evaluated_forest = True 
     
   def add_tree(self, position: Tuple[int, int, int], configuration_identifier: int, tree_configuration: dict[str, float]):
     """
     Adds a tree to the forest on the specified position and with the specified configuration.
+    The grid of the tree is a read-only template shared with all trees with the same configuration values,
+    until resolving a collision gives the tree its own copy.
 
     :param position: The position of the tree's stem in the voxel grid.
     :type position: Tuple[int, int, int]
@@ -156,13 +312,32 @@ class VoxelGrid:
     :return: None
     """
     
+    self.evaluated_forest = False
+    # keyed by the values, as the same identifier may refer to another configuration in a later call
+    template_key = (tuple(sorted((key, repr(value)) for key, value in tree_configuration.items())), self.cube_size)
+    tree_grid = self.shape_templates.get(template_key)
+    if tree_grid is None:
+      tree_grid = self.create_tree_grid(tree_configuration)
+      tree_grid.setflags(write=False)
+      self.shape_templates[template_key] = tree_grid
+    self.trees.append((int(position[0] / self.cube_size), int(position[1] / self.cube_size), int(position[2] / self.cube_size), configuration_identifier, tree_grid))
+  
+  def create_tree_grid(self, tree_configuration: dict[str, float]) -> np.ndarray:
+    """
+    Rasterizes the stem and crown of a tree configuration into a new voxel grid.
+    
+    :param tree_configuration: A dictionary containing the tree parameters, see add_tree.
+    :type tree_configuration: dict[str, float]
+    :return: The voxel grid of the tree, with the stem in the horizontal center.
+    :rtype: np.ndarray
+    """
+    
     crown_type_to_function = {
       "ellipsoid": self.add_ellipsoid_tree,
       "columnar": self.add_columnar_tree,
       "spreading": self.add_spreading_tree
     }
     
-    self.evaluated_forest = False
     stem_height = tree_configuration["stem_height"]
     stem_diameter = tree_configuration["stem_diameter"]
     crown_width = tree_configuration["crown_width"]
@@ -178,7 +353,7 @@ class VoxelGrid:
     
     self.add_stem(tree_grid, stem_diameter, stem_height)
     crown_type_to_function[tree_configuration["crown_type"]](tree_grid, tree_configuration)
-    self.trees.append((int(position[0] / self.cube_size), int(position[1] / self.cube_size), int(position[2] / self.cube_size), configuration_identifier, tree_grid))
+    return tree_grid
     
   def add_stem(self, tree_grid: np.ndarray, stem_diameter: float, stem_height: float):
     """
@@ -308,44 +483,298 @@ class VoxelGrid:
       k[mask] + int((stem_height-crown_offset) / self.cube_size)
     ] = CellType.crown.value
   
-  def evaluate_forest(self, tree_configurations: List[Dict[str, Any]]):
+  def evaluate_forest(self, tree_configurations: List[Dict[str, Any]], use_occupancy: bool = False, processes: int = None):
     """
     Evaluates the forest by checking for potential collisions between trees and resolving them.
     This method sets the `evaluated_forest` attribute to True indicating that it does not have to be
     reevaluated, unless new trees are added to the scene.
     
+    :param use_occupancy: If True, the pairs of trees whose crowns share a voxel are found by claiming the crowns in a sparse 
+      world occupancy grid in a single pass, instead of testing all pairs of trees within range of each other.
+      Either way only these pairs are scheduled, resolving a collision never grows a crown, so other pairs can not collide 
+      later on. Both detectors find the same pairs and therefore produce the same forest.
+    :type use_occupancy: bool, optional
+    :param processes: The number of processes used to resolve independent collisions in parallel, see schedule_collisions.
+      The trees are resolved in this process by default, the result does not depend on the number of processes.
+      Worker processes are only used where can_fork_workers allows it, i.e. in Blender's background mode on Linux or macOS.
+    :type processes: int, optional
     :return: None
     :rytpe: None
     """
     
     self.evaluated_forest = True
+    self.crown_boxes = {}
+    self.collision_statistics = {"skipped": 0, "disjoint": 0, "resolved": 0}
     
-    tree_widths = [tree_configurations[tree[3]]["crown_width"] for tree in self.trees]
+    pairs_to_evaluate: Set[Tuple[int, int]] = set()
     
-    max_range = np.max(tree_widths)
+    if use_occupancy:
+      # only a pair detector, it is dropped once the pairs are known and does not follow the resolved trees
+      occupancy = SparseOccupancyGrid()
+      for i, tree in enumerate(self.trees):
+        crown_cells = np.argwhere(tree[-1] == CellType.crown.value) + self.tree_origin(tree)
+        pairs_to_evaluate.update(occupancy.add(i, crown_cells))
+    else:
+      tree_widths = [tree_configurations[tree[3]]["crown_width"] for tree in self.trees]
+      
+      max_range = np.max(tree_widths)
+      
+      tree_positions = KDTree([t[:3] for t in self.trees])
+      
+      for i, tree in enumerate(self.trees):
+        potential_collisions = tree_positions.query_ball_point(tree[:3], max_range + tree_widths[i])
+        
+        for collision_index in potential_collisions:
+          if collision_index == i:
+            continue
+          pair = (min(i, collision_index), max(i, collision_index))
+          if pair not in pairs_to_evaluate and self.crowns_intersect(*pair):
+            pairs_to_evaluate.add(pair)
+    
+    rounds = self.schedule_collisions(pairs_to_evaluate)
+    
+    if processes is None or processes <= 1 or not can_fork_workers():
+      for round_pairs in rounds:
+        self.resolve_collisions(self.trees, round_pairs)
+    else:
+      self.resolve_collisions_in_processes(rounds, processes)
+  
+  def schedule_collisions(self, pairs: Set[Tuple[int, int]]) -> List[List[Tuple[int, int, int]]]:
+    """
+    Orders the collisions between pairs of trees into rounds that can be resolved independently.
+    The collision graph is partitioned into connected components, and the shuffled pairs of every component are colored
+    greedily so that no two pairs of a round share a tree. Round i of the forest contains round i of every component.
+    Every pair gets its own seed drawn from the random module, so the result of resolving the rounds only depends on that seed 
+    and not on how the pairs of a round are distributed among processes.
+    
+    :param pairs: The pairs (smaller index, larger index) of trees that may collide.
+    :type pairs: Set[Tuple[int, int]]
+    :return: The rounds, each a list of tuples containing the indices of the two trees and the seed for resolving them.
+    :rtype: List[List[Tuple[int, int, int]]]
+    """
     
-    tree_positions = KDTree([t[:3] for t in self.trees])
+    if len(pairs) == 0:
+      return []
     
-    pairs_to_evaluate: Set[Tuple[int, int]] = set()
+    pairs_list = sorted(pairs)
+    pair_array = np.array(pairs_list)
+    graph = coo_matrix((np.ones(len(pairs_list)), (pair_array[:, 0], pair_array[:, 1])), shape=(len(self.trees), len(self.trees)))
+    _, component_labels = connected_components(graph, directed=False)
+    
+    component_pairs: Dict[int, List[Tuple[int, int]]] = {}
+    for pair in pairs_list:
+      component_pairs.setdefault(int(component_labels[pair[0]]), []).append(pair)
     
-    for i, tree in enumerate(self.trees):
-      potential_collisions = tree_positions.query_ball_point(tree[:3], max_range + tree_widths[i])
+    base_seed = random.getrandbits(64)
+    rounds: List[List[Tuple[int, int, int]]] = []
+    for component in sorted(component_pairs):
+      pairs_of_component = component_pairs[component]
+      random.shuffle(pairs_of_component)
       
-      for collision_index in potential_collisions:
-        if collision_index == i:
+      used_rounds: Dict[int, Set[int]] = {}
+      for first, second in pairs_of_component:
+        first_rounds = used_rounds.setdefault(first, set())
+        second_rounds = used_rounds.setdefault(second, set())
+        round_index = 0
+        while round_index in first_rounds or round_index in second_rounds:
+          round_index += 1
+        first_rounds.add(round_index)
+        second_rounds.add(round_index)
+        if round_index == len(rounds):
+          rounds.append([])
+        seed = int(np.random.SeedSequence([base_seed, first, second]).generate_state(1)[0])
+        rounds[round_index].append((first, second, seed))
+    
+    return rounds
+  
+  def resolve_collisions(self, trees, pairs: List[Tuple[int, int, int]]):
+    """
+    Resolves the collisions between the given pairs of trees one after another, each with its own seed.
+    Pairs whose crown bounding boxes do not overlap can not collide and are skipped, the others are resolved
+    within the overlap of their bounding boxes. The state of the random module is restored afterwards.
+    
+    :param trees: The trees, indexed by the tree indices of the pairs. Trees whose grids are modified are replaced.
+    :type trees: Union[List[Tuple[int, int, int, int, np.ndarray]], Dict[int, Tuple[int, int, int, int, np.ndarray]]]
+    :param pairs: The indices of the two trees of every collision and the seed used for resolving it.
+    :type pairs: List[Tuple[int, int, int]]
+    :return: None
+    """
+    
+    state = random.getstate()
+    try:
+      for first, second, seed in pairs:
+        first_box = self.crown_box(first, trees[first])
+        second_box = self.crown_box(second, trees[second])
+        if first_box is None or second_box is None:
+          self.collision_statistics["skipped"] += 1
+          continue
+        overlap = (np.maximum(first_box[0], second_box[0]), np.minimum(first_box[1], second_box[1]))
+        if np.any(overlap[0] >= overlap[1]):
+          self.collision_statistics["skipped"] += 1
           continue
-        pair = (min(i, collision_index), max(i, collision_index))
-        pairs_to_evaluate.add(pair)
+        
+        random.seed(seed)
+        resolved_trees = self.resolve_collision(trees[first], trees[second], overlap)
+        if resolved_trees is None:
+          self.collision_statistics["disjoint"] += 1
+          continue
+        trees[first], trees[second], collision_cells = resolved_trees
+        self.shrink_crown_box(first, trees[first], collision_cells)
+        self.shrink_crown_box(second, trees[second], collision_cells)
+        self.collision_statistics["resolved"] += 1
+    finally:
+      random.setstate(state)
+  
+  def crowns_intersect(self, first: int, second: int) -> bool:
+    """
+    Checks if the crowns of two trees share a voxel, by comparing both grids within the overlap of their crown bounding boxes.
+    
+    :param first: The index of the first tree.
+    :type first: int
+    :param second: The index of the second tree.
+    :type second: int
+    :return: True if at least one world voxel is a crown cell of both trees.
+    :rtype: bool
+    """
+    
+    first_box = self.crown_box(first, self.trees[first])
+    second_box = self.crown_box(second, self.trees[second])
+    if first_box is None or second_box is None:
+      return False
+    start = np.maximum(first_box[0], second_box[0])
+    end = np.minimum(first_box[1], second_box[1])
+    if np.any(start >= end):
+      return False
+    
+    crowns = []
+    for tree in (self.trees[first], self.trees[second]):
+      crop_start = start - self.tree_origin(tree)
+      crop_end = end - self.tree_origin(tree)
+      crowns.append(tree[-1][crop_start[0]:crop_end[0], crop_start[1]:crop_end[1], crop_start[2]:crop_end[2]] == CellType.crown.value)
+    return bool(np.any(crowns[0] & crowns[1]))
+  
+  def crown_box(self, index: int, tree: Tuple[int, int, int, int, np.ndarray]):
+    """
+    Gets the cached world voxel bounding box of a tree crown, computing it if necessary.
+    
+    :param index: The index of the tree.
+    :type index: int
+    :param tree: The tree's position and voxel grid.
+    :type tree: Tuple[int, int, int, int, np.ndarray]
+    :return: The inclusive minimum and exclusive maximum world voxel coordinates of the crown, or None if it has no crown cells.
+    :rtype: Optional[Tuple[np.ndarray, np.ndarray]]
+    """
+    
+    if index not in self.crown_boxes:
+      box = self.get_crown_extent(tree[-1])
+      if box is None:
+        self.crown_boxes[index] = None
+      else:
+        origin = self.tree_origin(tree)
+        self.crown_boxes[index] = (origin + box[0], origin + box[1])
+    return self.crown_boxes[index]
+  
+  def shrink_crown_box(self, index: int, tree: Tuple[int, int, int, int, np.ndarray], cleared_cells: np.ndarray):
+    """
+    Updates the cached crown bounding box of a tree after some of its crown cells may have been cleared.
+    Resolving collisions never adds crown cells, so the box can only shrink, and only where a cleared cell lies on 
+    one of its faces. In that case the box is recomputed within the old box instead of the whole tree grid.
+    
+    :param index: The index of the tree.
+    :type index: int
+    :param tree: The tree's position and voxel grid after the cells were cleared.
+    :type tree: Tuple[int, int, int, int, np.ndarray]
+    :param cleared_cells: A numpy array of shape (n, 3) with the world voxel coordinates of the cells that may have been cleared.
+    :type cleared_cells: np.ndarray
+    :return: None
+    """
     
-    pairs_to_evaluate_list = list(pairs_to_evaluate)
-    random.shuffle(pairs_to_evaluate_list)
+    box = self.crown_boxes.get(index)
+    if box is None:
+      return
+    if not np.any((cleared_cells == box[0]) | (cleared_cells == box[1] - 1)):
+      return
+    
+    start, end = box[0] - self.tree_origin(tree), box[1] - self.tree_origin(tree)
+    shrunk_box = self.get_crown_extent(tree[-1][start[0]:end[0], start[1]:end[1], start[2]:end[2]])
+    if shrunk_box is None:
+      self.crown_boxes[index] = None
+    else:
+      self.crown_boxes[index] = (box[0] + shrunk_box[0], box[0] + shrunk_box[1])
+  
+  def get_crown_extent(self, tree_grid: np.ndarray):
+    """
+    Computes the bounding box of the crown cells of a grid.
     
-    for pair in pairs_to_evaluate_list:
-      tree = self.trees[pair[0]]
-      other_tree = self.trees[pair[1]]
-      self.resolve_collision(tree, other_tree)
+    :param tree_grid: A 3D numpy array representing the tree grid, or a part of it.
+    :type tree_grid: np.ndarray
+    :return: The inclusive minimum and exclusive maximum cell coordinates of the crown, or None if it has no crown cells.
+    :rtype: Optional[Tuple[np.ndarray, np.ndarray]]
+    """
+    
+    crown_mask = tree_grid == CellType.crown.value
+    extents = [np.flatnonzero(np.any(crown_mask, axis=axes)) for axes in ((1, 2), (0, 2), (0, 1))]
+    if len(extents[0]) == 0:
+      return None
+    return np.array([extent[0] for extent in extents]), np.array([extent[-1] + 1 for extent in extents])
+  
+  def resolve_collisions_in_processes(self, rounds: List[List[Tuple[int, int, int]]], processes: int):
+    """
+    Resolves the rounds of collisions with a pool of worker processes. The grids of the trees taking part in a collision 
+    are copied into one shared memory block, so the workers modify them in place, and the pairs of every round are split 
+    into one batch per process. Trees whose grids end up unchanged keep their shared templates.
+    
+    :param rounds: The rounds of collisions as returned by schedule_collisions.
+    :type rounds: List[List[Tuple[int, int, int]]]
+    :param processes: The number of worker processes.
+    :type processes: int
+    :return: None
+    """
+    
+    involved_trees = sorted({index for round_pairs in rounds for pair in round_pairs for index in pair[:2]})
+    if len(involved_trees) == 0:
+      return
+    
+    layout = {}
+    offset = 0
+    for index in involved_trees:
+      x, y, z, configuration_index, tree_grid = self.trees[index]
+      layout[index] = (x, y, z, configuration_index, offset, tree_grid.shape)
+      offset += tree_grid.nbytes
+    
+    shared_memory = SharedMemory(create=True, size=offset)
+    try:
+      shared_trees = {}
+      for index in involved_trees:
+        x, y, z, configuration_index, tree_offset, shape = layout[index]
+        shared_grid = np.ndarray(shape, dtype=np.int8, buffer=shared_memory.buf, offset=tree_offset)
+        shared_grid[...] = self.trees[index][-1]
+        shared_trees[index] = (x, y, z, configuration_index, shared_grid)
+      
+      with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("fork")) as executor:
+        for round_pairs in rounds:
+          if len(round_pairs) < 2 * processes:
+            # small rounds are not worth the round trip to the workers
+            self.resolve_collisions(shared_trees, round_pairs)
+            continue
+          batches = [round_pairs[start::processes] for start in range(processes)]
+          for statistics in executor.map(resolve_collision_batch, [shared_memory.name] * processes, [layout] * processes, batches):
+            for key, count in statistics.items():
+              self.collision_statistics[key] += count
+          # the workers changed the grids of the round
+          for first, second, _ in round_pairs:
+            self.crown_boxes.pop(first, None)
+            self.crown_boxes.pop(second, None)
+      
+      for index, tree in shared_trees.items():
+        if not np.array_equal(tree[-1], self.trees[index][-1]):
+          self.trees[index] = tree[:4] + (np.array(tree[-1]),)
+      del shared_trees, shared_grid, tree
+    finally:
+      shared_memory.close()
+      shared_memory.unlink()
         
-  def resolve_collision(self, tree1: Tuple[int, int, int, int, np.ndarray], tree2: Tuple[int, int, int, int, np.ndarray]):
+  def resolve_collision(self, tree1: Tuple[int, int, int, int, np.ndarray], tree2: Tuple[int, int, int, int, np.ndarray], overlap: Tuple[np.ndarray, np.ndarray] = None):
     """
     Resolves the collision between two voxel grids representing trees.
     In this algorithm, some cells are marked as collision cells with specific values.
@@ -355,26 +784,40 @@ class VoxelGrid:
     :type tree1: Tuple[int, int, int, np.ndarray]
     :param tree2: The second tree's position and voxel grid.
     :type tree2: Tuple[int, int, int, np.ndarray]
-    :return: None
-    :rtype: None
+    :param overlap: The world voxel box (inclusive minimum, exclusive maximum) containing all collisions, e.g. the overlap of 
+      the crown bounding boxes. Only this part of the first grid is searched for colliding cells.
+    :type overlap: Tuple[np.ndarray, np.ndarray], optional
+    :return: None if the trees do not collide, otherwise both trees, with read-only template grids replaced by modified copies,
+      and the world voxel coordinates of the collision cells, the only cells of both trees that were changed.
+    :rtype: Optional[Tuple[Tuple[int, int, int, int, np.ndarray], Tuple[int, int, int, int, np.ndarray], np.ndarray]]
     """
     
-    x1, y1, z1, _, tree1_grid = tree1
-    x2, y2, z2, _, tree2_grid = tree2
+    tree1_grid = tree1[-1]
+    tree2_grid = tree2[-1]
     
-    tree1_shape = tree1_grid.shape
-    tree2_shape = tree2_grid.shape
-    translation = np.array([x1, y1, z1]) - np.array([tree1_shape[0]/2, tree1_shape[1]/2, 0]) - np.array([x2, y2, z2]) + np.array([tree2_shape[0]/2, tree2_shape[1]/2, 0])
-    translation = translation.astype(int)
+    tree1_origin = self.tree_origin(tree1)
+    translation = tree1_origin - self.tree_origin(tree2)
     
-    tree1_filled_cells = np.argwhere(tree1_grid == CellType.crown.value)
+    if overlap is None:
+      tree1_filled_cells = np.argwhere(tree1_grid == CellType.crown.value)
+    else:
+      crop_start = np.clip(overlap[0] - tree1_origin, 0, tree1_grid.shape)
+      crop_end = np.clip(overlap[1] - tree1_origin, crop_start, tree1_grid.shape)
+      cropped_grid = tree1_grid[crop_start[0]:crop_end[0], crop_start[1]:crop_end[1], crop_start[2]:crop_end[2]]
+      tree1_filled_cells = np.argwhere(cropped_grid == CellType.crown.value) + crop_start
     
     # translate to tree2 coordinate space
     tree1_filled_cells = tree1_filled_cells + translation
     
     tree2_collision_cells = self.get_colliding_cells(tree2_grid, tree1_filled_cells)
     if len(tree2_collision_cells) == 0:
-      return
+      return None
+    
+    # copy on write of shared template grids
+    tree1 = self.materialize_tree(tree1)
+    tree2 = self.materialize_tree(tree2)
+    tree1_grid = tree1[-1]
+    tree2_grid = tree2[-1]
     tree1_collision_cells = tree2_collision_cells - translation
     
     tree1_collision_edge_cells = self.get_collision_edge_cells(tree1_grid, tree2_collision_cells - translation)
@@ -385,6 +828,36 @@ class VoxelGrid:
     tree2_grid[tree2_collision_cells[:, 0], tree2_collision_cells[:, 1], tree2_collision_cells[:, 2]] = CellType.collision.value
     
     self.assign_collision_cells(tree1_grid, tree2_grid, tree1_collision_edge_cells, tree2_collision_edge_cells, translation)
+    return tree1, tree2, tree1_collision_cells + tree1_origin
+  
+  def materialize_tree(self, tree: Tuple[int, int, int, int, np.ndarray]) -> Tuple[int, int, int, int, np.ndarray]:
+    """
+    Gives a tree its own writable grid if it still uses a read-only template grid.
+    
+    :param tree: The tree's position and voxel grid.
+    :type tree: Tuple[int, int, int, int, np.ndarray]
+    :return: The tree with a writable voxel grid.
+    :rtype: Tuple[int, int, int, int, np.ndarray]
+    """
+    
+    if tree[-1].flags.writeable:
+      return tree
+    return tree[:4] + (tree[-1].copy(),)
+  
+  def tree_origin(self, tree: Tuple[int, int, int, int, np.ndarray]) -> np.ndarray:
+    """
+    Computes the world voxel coordinates of the first cell of a tree grid. The stem is in the horizontal center of the grid,
+    grids with an odd width are shifted by half a voxel towards the negative axes so all trees share one world voxel grid.
+    
+    :param tree: The tree's position and voxel grid.
+    :type tree: Tuple[int, int, int, int, np.ndarray]
+    :return: The world voxel coordinates of the cell (0, 0, 0) of the tree grid.
+    :rtype: np.ndarray
+    """
+    
+    x, y, z = tree[:3]
+    tree_shape = tree[-1].shape
+    return np.floor(np.array([x - tree_shape[0]/2, y - tree_shape[1]/2, z])).astype(int)
   
   def get_colliding_cells(self, tree_grid: np.ndarray, filled_translated_cells: np.ndarray):
     """
@@ -558,15 +1031,10 @@ class VoxelGrid:
     """
     
     tree1_collision_cells = np.argwhere(tree1_grid == CellType.collision.value)
-
-    mask = (tree1_grid != CellType.stem.value) | (tree1_grid != CellType.crown.value)
-    tree1_distances = distance_transform_edt(mask)
-    tree1_conflicted_distances = tree1_distances[tree1_collision_cells[:, 0], tree1_collision_cells[:, 1], tree1_collision_cells[:, 2]]
+    tree1_conflicted_distances = self.get_distances_to_tree(tree1_grid, tree1_collision_cells)
     
     tree2_collision_cells = tree1_collision_cells + translation
-    mask = (tree2_grid != CellType.stem.value) | (tree2_grid != CellType.crown.value)
-    tree2_distances = distance_transform_edt(mask)
-    tree2_conflicted_distances = tree2_distances[tree2_collision_cells[:, 0], tree2_collision_cells[:, 1], tree2_collision_cells[:, 2]]
+    tree2_conflicted_distances = self.get_distances_to_tree(tree2_grid, tree2_collision_cells)
     
     tree1_cells_closer = tree1_collision_cells[tree1_conflicted_distances <= tree2_conflicted_distances]
     tree1_cells_farther = tree1_collision_cells[tree1_conflicted_distances > tree2_conflicted_distances]
@@ -580,6 +1048,47 @@ class VoxelGrid:
     tree2_grid[tree2_cells_closer[:, 0], tree2_cells_closer[:, 1], tree2_cells_closer[:, 2]] = CellType.crown.value
     tree2_grid[tree2_cells_farther[:, 0], tree2_cells_farther[:, 1], tree2_cells_farther[:, 2]] = CellType.no_tree.value
   
+  def get_distances_to_tree(self, tree_grid: np.ndarray, cells: np.ndarray) -> np.ndarray:
+    """
+    Computes the euclidean distances of the given cells to the nearest stem or crown cell of a tree grid.
+    The distance transform only runs on a box around the cells padded by the largest distance found, which is enough,
+    as all cells outside of the box are farther away. The padding starts small and is doubled until it suffices.
+    
+    :param tree_grid: The voxel grid representing the tree.
+    :type tree_grid: np.ndarray
+    :param cells: A numpy array of shape (n, 3) containing the cells, e.g. the collision cells of the tree.
+    :type cells: np.ndarray
+    :return: A numpy array of shape (n,) containing the distances.
+    :rtype: np.ndarray
+    """
+    
+    if len(cells) == 0:
+      return np.zeros(0)
+    
+    grid_shape = np.array(tree_grid.shape)
+    cells_start = cells.min(axis=0)
+    cells_end = cells.max(axis=0) + 1
+    padding = 2
+    while True:
+      if self.restrict_distance_transform:
+        box_start = np.maximum(cells_start - padding, 0)
+        box_end = np.minimum(cells_end + padding, grid_shape)
+      else:
+        box_start, box_end = np.zeros(3, dtype=int), grid_shape
+      covers_grid = np.all(box_start == 0) and np.all(box_end == grid_shape)
+      
+      box = tree_grid[box_start[0]:box_end[0], box_start[1]:box_end[1], box_start[2]:box_end[2]]
+      mask = (box != CellType.stem.value) & (box != CellType.crown.value)
+      if mask.all() and not covers_grid:
+        padding *= 2
+        continue
+      
+      box_cells = cells - box_start
+      distances = distance_transform_edt(mask)[box_cells[:, 0], box_cells[:, 1], box_cells[:, 2]]
+      if covers_grid or distances.max() <= padding:
+        return distances
+      padding = max(2 * padding, int(np.ceil(distances.max())))
+  
   def translate_voxel_to_local_space(self, tree: Tuple[int, int, int, np.ndarray], voxel: Tuple[int, int, int]):
     """
     Translates a voxel in the global space to the local space of the tree.
@@ -594,7 +1103,7 @@ class VoxelGrid:
     tree_shape = tree[-1].shape
     return ((voxel[0] - tree_shape[0]/2) * self.cube_size, (voxel[1] - tree_shape[1]/2) * self.cube_size, voxel[2] * self.cube_size)
   
-  def greedy_meshing(self, index: int):
+  def greedy_meshing(self, index: int, surface_only: bool = False):
     """
     Generate a mesh object using greedy meshing algorithm for a given index.
     This function generates a mesh object by capturing quads from the voxel grid and creating corresponding geometry 
@@ -602,14 +1111,32 @@ class VoxelGrid:
     
     :param index: The index of the tree for which the mesh is to be generated.
     :type index: int
+    :param surface_only: If True, only the exposed faces of the crown are emitted with shared vertices, see capture_surface,
+      and the mesh is filled in bulk from NumPy arrays instead of creating every box with bmesh.
+    :type surface_only: bool, optional
     :return: The generated mesh object.
     :rtype: bpy.types.Object
     """  
     
-    quads = self.capture_quads(index)
-    
     mesh = bpy.data.meshes.new(f"VoxelMesh")
     obj = bpy.data.objects.new(f"VoxelObject_{index}", mesh)
+    
+    if surface_only:
+      vertices, faces = self.capture_surface(index)
+      mesh.vertices.add(len(vertices))
+      mesh.vertices.foreach_set("co", vertices.astype(np.float32).ravel())
+      mesh.loops.add(faces.size)
+      mesh.loops.foreach_set("vertex_index", faces.ravel())
+      mesh.polygons.add(len(faces))
+      mesh.polygons.foreach_set("loop_start", np.arange(0, faces.size, 4, dtype=np.int32))
+      # before Blender 3.6 the loop count of every polygon is stored as well, later it follows from the loop starts
+      if not mesh.polygons.bl_rna.properties["loop_total"].is_readonly:
+        mesh.polygons.foreach_set("loop_total", np.full(len(faces), 4, dtype=np.int32))
+      mesh.update(calc_edges=True)
+      obj.location = tuple(np.array(self.trees[index][:3]) * self.cube_size)
+      return self.trees[index][3], obj
+    
+    quads = self.capture_boxes(index)
 
     # Prepare bmesh for geometry creation
     bm = bmesh.new()
@@ -658,6 +1185,8 @@ class VoxelGrid:
     """
     Generates the quads used for the greedy meshing algorithm in the voxel grid for a given tree index.
     A quad is generated by merging the largest possible sections in all three dimensions with the order X, Y, Z.
+    The meshing uses capture_boxes, this implementation together with capture_planes and capture_rows is kept as the 
+    reference for it in tests/test_greedy_meshing.py and cluster_scripts/meshing_benchmark.py.
     
     :param index: The index of the tree in the voxel grid.
     :type index: int
@@ -678,6 +1207,232 @@ class VoxelGrid:
     
     return quads
   
+  def capture_boxes(self, index: int):
+    """
+    Generates the same boxes as capture_quads with NumPy arrays instead of dictionaries of sets, see merge_cells.
+    As capture_quads always merges the whole chain of identical segments, both produce the same boxes, 
+    only their order differs.
+    
+    :param index: The index of the tree in the voxel grid.
+    :type index: int
+    :return: A list of boxes, each represented as a tuple of six integers (x_start, y_start, z_start, x_end, y_end, z_end)
+      with inclusive ends.
+    :rtype: List[Tuple[int, int, int, int, int, int]]
+    """
+    
+    boxes = self.merge_cells(self.trees[index][-1] == CellType.crown.value)
+    return [tuple(box) for box in boxes.tolist()]
+  
+  def marching_cubes_mesh(self, index: int, step_size: int = 2, smoothing: float = 1.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Generates a smooth iso-surface of a tree crown with marching cubes, as a lighter alternative to the box meshes.
+    The crown cells are blurred and padded with empty cells, so the surface at half density is closed and watertight. 
+    Sampling only every step_size-th cell decimates the surface, crowns too thin to be hit by the samples are sampled 
+    at every cell instead. The forest generator still meshes the crowns with greedy_meshing, the smooth surface is only 
+    used for sampling the crown when it is enabled, see sample_crown_surface.
+    
+    :param index: The index of the tree in the voxel grid.
+    :type index: int
+    :param step_size: The step size in cells of marching cubes, larger steps give fewer and larger triangles.
+    :type step_size: int, optional
+    :param smoothing: The standard deviation in cells of the gaussian blur applied to the crown cells, 0 disables it.
+    :type smoothing: float, optional
+    :return: The vertices of shape (n, 3) in the local space of the tree, as used by greedy_meshing, and the triangles of 
+      shape (m, 3) as vertex indices, oriented to face outwards.
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    
+    tree_grid = self.trees[index][-1]
+    crown = (tree_grid == CellType.crown.value).astype(np.float32)
+    if not crown.any():
+      return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int32)
+    
+    # the padding keeps the blurred crown and the coarsest sampled layer away from the border of the volume
+    padding = step_size + int(np.ceil(3 * smoothing))
+    volume = np.pad(crown, padding)
+    if smoothing > 0:
+      volume = gaussian_filter(volume, smoothing)
+    if volume.max() <= 0.5:
+      # the crown is too thin to survive the blur
+      volume = np.pad(crown, padding)
+    if volume[::step_size, ::step_size, ::step_size].max() <= 0.5:
+      # marching cubes only sees the strided samples and finds no surface if none of them is inside the crown
+      step_size = 1
+    
+    vertices, faces, _, _ = marching_cubes(volume, level=0.5, step_size=step_size, allow_degenerate=False)
+    
+    # the center of cell i is at i + padding in the volume and at (i - 0.5) translated voxel units in greedy_meshing
+    vertices = (vertices - padding - 0.5 - np.array([tree_grid.shape[0] / 2, tree_grid.shape[1] / 2, 0])) * self.cube_size
+    # marching cubes orders the triangles clockwise when seen from the lower values outside
+    return vertices, faces[:, ::-1].astype(np.int32)
+  
+  def merge_cells(self, mask: np.ndarray, merge_layers: bool = True) -> np.ndarray:
+    """
+    Greedily merges the filled cells of a mask into boxes.
+    The runs of filled cells along the X axis are found in one pass, then runs with the same extent in consecutive rows are 
+    merged along Y into planes, and planes with the same extent in consecutive layers are merged along Z into boxes.
+    Each merge sorts the segments so that the segments of a chain are adjacent and starts a new chain wherever the extent 
+    changes or a row or layer is skipped.
+    
+    :param mask: A 3D boolean numpy array of the filled cells.
+    :type mask: np.ndarray
+    :param merge_layers: If False, the planes are not merged along Z, so every box is one layer thick.
+    :type merge_layers: bool, optional
+    :return: A numpy array of shape (n, 6) with the boxes (x_start, y_start, z_start, x_end, y_end, z_end) with inclusive ends.
+    :rtype: np.ndarray
+    """
+    
+    # (z, y, x) order, so the starts and ends of the runs are found in the same order
+    instance_matrix = mask.transpose(2, 1, 0).astype(np.int8)
+    diff_x = np.diff(instance_matrix, axis=2, prepend=0, append=0)
+    z_position, y_position, x_start = np.nonzero(diff_x > 0)
+    x_end = np.nonzero(diff_x < 0)[2] - 1
+    
+    def merge_chains(keys, position):
+      """
+      Finds the chains of segments with equal keys at consecutive positions.
+      Returns the indices of the first and the last segment of every chain.
+      """
+      
+      order = np.lexsort((position,) + tuple(reversed(keys)))
+      sorted_position = position[order]
+      continues_chain = np.ones(len(order), dtype=bool)
+      continues_chain[0] = False
+      continues_chain[1:] &= sorted_position[1:] == sorted_position[:-1] + 1
+      for key in keys:
+        sorted_key = key[order]
+        continues_chain[1:] &= sorted_key[1:] == sorted_key[:-1]
+      first = np.flatnonzero(~continues_chain)
+      last = np.append(first[1:] - 1, len(order) - 1)
+      return order[first], order[last]
+    
+    if len(x_start) == 0:
+      return np.zeros((0, 6), dtype=int)
+    
+    # rows to planes along Y
+    first, last = merge_chains((z_position, x_start, x_end), y_position)
+    plane_z = z_position[first]
+    plane_x_start = x_start[first]
+    plane_x_end = x_end[first]
+    plane_y_start = y_position[first]
+    plane_y_end = y_position[last]
+    
+    # planes to boxes along Z
+    if merge_layers:
+      first, last = merge_chains((plane_x_start, plane_y_start, plane_x_end, plane_y_end), plane_z)
+    else:
+      first = last = np.arange(len(plane_z))
+    return np.stack((
+      plane_x_start[first], plane_y_start[first], plane_z[first], 
+      plane_x_end[first], plane_y_end[first], plane_z[last]
+    ), axis=1)
+  
+  def get_exposed_faces(self, tree_grid: np.ndarray):
+    """
+    Finds the faces of the crown cells that are not covered by another crown cell, one direction at a time.
+    
+    :param tree_grid: A 3D numpy array representing the tree grid.
+    :type tree_grid: np.ndarray
+    :return: A generator of (axis, side, exposed) for the six face directions, where side is -1 or 1 and exposed is a 
+      boolean mask of the crown cells whose face towards side along axis is exposed.
+    :rtype: Generator[Tuple[int, int, np.ndarray], None, None]
+    """
+    
+    crown = tree_grid == CellType.crown.value
+    padded_crown = np.pad(crown, 1)
+    for axis in range(3):
+      for side in (-1, 1):
+        neighbor = np.roll(padded_crown, -side, axis=axis)[1:-1, 1:-1, 1:-1]
+        yield axis, side, crown & ~neighbor
+  
+  def sample_crown_surface(self, index: int, n_points: int, seed: int = 0, smooth: bool = False) -> np.ndarray:
+    """
+    Samples points uniformly on the exposed faces of the crown cells of a tree, as endpoints for the space colonization.
+    All faces have the same area, so a uniformly chosen face with a uniform point on it samples the surface by area.
+    This replaces sampling the crown mesh, so the crown does not have to be meshed and linked into the scene first.
+    
+    :param index: The index of the tree in the voxel grid.
+    :type index: int
+    :param n_points: The number of points to sample.
+    :type n_points: int
+    :param seed: The seed of the random generator, the same seed returns the same points.
+    :type seed: int, optional
+    :param smooth: If True, the points are sampled by area on the triangles of marching_cubes_mesh instead,
+      which rounds off the steps between the cell faces.
+    :type smooth: bool, optional
+    :return: The points of shape (n_points, 3) in the local space of the tree, as used by greedy_meshing.
+    :rtype: np.ndarray
+    """
+    
+    if smooth:
+      vertices, faces = self.marching_cubes_mesh(index)
+      if len(faces) == 0:
+        return np.zeros((0, 3))
+      triangles = vertices[faces]
+      return sample_triangles(triangles, np.cumsum(get_triangle_areas(triangles)), n_points, np.random.default_rng(seed))
+    
+    tree_grid = self.trees[index][-1]
+    cells, axes, sides = [], [], []
+    for axis, side, exposed in self.get_exposed_faces(tree_grid):
+      exposed_cells = np.argwhere(exposed)
+      cells.append(exposed_cells)
+      axes.append(np.full(len(exposed_cells), axis))
+      sides.append(np.full(len(exposed_cells), side > 0))
+    cells, axes, sides = np.concatenate(cells), np.concatenate(axes), np.concatenate(sides)
+    if len(cells) == 0:
+      return np.zeros((0, 3))
+    
+    rng = np.random.default_rng(seed)
+    chosen = rng.integers(len(cells), size=n_points)
+    # a uniform point in the cell, moved onto the chosen face along the axis of the face
+    offsets = rng.random((n_points, 3))
+    offsets[np.arange(n_points), axes[chosen]] = sides[chosen]
+    corners = cells[chosen] + offsets
+    
+    # a cell spans the corners i to i + 1, its box in greedy_meshing spans (i - 1) to i in translated voxel units
+    return (corners - 1 - np.array([tree_grid.shape[0] / 2, tree_grid.shape[1] / 2, 0])) * self.cube_size
+  
+  def capture_surface(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Generates the surface of a tree crown from the exposed faces of its crown cells only.
+    For every direction, the exposed cell faces in each layer are merged greedily into rectangles, and the corners of 
+    all rectangles are deduplicated into one vertex array. Rectangles of different sizes can meet in T-junctions.
+    
+    :param index: The index of the tree in the voxel grid.
+    :type index: int
+    :return: The vertices of shape (n, 3) in the local space of the tree, as used by greedy_meshing, 
+      and the quads of shape (m, 4) as vertex indices, ordered counterclockwise when seen from outside.
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    
+    tree_grid = self.trees[index][-1]
+    
+    quads = []
+    for axis, side, exposed in self.get_exposed_faces(tree_grid):
+      # (u, v, axis) is a right-handed order of the axes
+      u_axis, v_axis = (axis + 1) % 3, (axis + 2) % 3
+      rectangles = self.merge_cells(exposed.transpose(u_axis, v_axis, axis), merge_layers=False)
+      
+      u_start, v_start, layer = rectangles[:, 0], rectangles[:, 1], rectangles[:, 2]
+      u_end, v_end = rectangles[:, 3] + 1, rectangles[:, 4] + 1
+      plane = layer + (1 if side > 0 else 0)
+      corners = np.empty((len(rectangles), 4, 3), dtype=int)
+      corners[:, :, axis] = plane[:, None]
+      corners[:, :, u_axis] = np.stack((u_start, u_end, u_end, u_start), axis=1)
+      corners[:, :, v_axis] = np.stack((v_start, v_start, v_end, v_end), axis=1)
+      if side < 0:
+        corners = corners[:, ::-1]
+      quads.append(corners)
+    
+    corners = np.concatenate(quads).reshape(-1, 3)
+    if len(corners) == 0:
+      return np.zeros((0, 3)), np.zeros((0, 4), dtype=np.int32)
+    corner_positions, faces = np.unique(corners, axis=0, return_inverse=True)
+    
+    # a cell spans the corners i to i + 1, its box in greedy_meshing spans (i - 1) to i in translated voxel units
+    vertices = (corner_positions - 1 - np.array([tree_grid.shape[0] / 2, tree_grid.shape[1] / 2, 0])) * self.cube_size
+    return vertices, faces.reshape(-1, 4).astype(np.int32)
+  
   def capture_quad(self, z_position: int, x_start: int, y_start: int, x_end: int, y_end: int, planes: Dict[int, Set[Tuple[int, int, int, int]]]):
     """
     Captures a quad segment of a voxel grid by taking a X-Y plane and expanding it vertically until the segments no